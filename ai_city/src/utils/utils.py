@@ -1,8 +1,5 @@
 import fitz
 
 def extract_text_from_pdf(pdf_path):
-    text = ""
     with fitz.open(pdf_path) as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
\ No newline at end of file
+        return "".join(page.get_text() for page in doc)
\ No newline at end of file
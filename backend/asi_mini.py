@@ -1,31 +1,209 @@
+import asyncio
 import json
+import logging
 import requests
+import aiohttp
 import os
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from llm_cache import completion_cache, make_cache_key
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MODEL = "asi1-mini"
 URL = "https://api.asi1.ai/v1/chat/completions"
 API_KEY = os.getenv('ASI_ONE_KEY')
+TEMPERATURE = 0.2
 
-def call_asi_one_chatbot(messages, tokens):
-    headers = {
+# Connection pool and timeout settings (seconds)
+CONNECT_TIMEOUT = float(os.getenv('ASI_ONE_CONNECT_TIMEOUT', '10'))
+REQUEST_TIMEOUT = float(os.getenv('ASI_ONE_TIMEOUT', '120'))
+KEEPALIVE_TIMEOUT = float(os.getenv('ASI_ONE_KEEPALIVE_TIMEOUT', '60'))
+MAX_CONNECTIONS = int(os.getenv('ASI_ONE_MAX_CONNECTIONS', '20'))
+MAX_CONCURRENT_REQUESTS = int(os.getenv('ASI_ONE_MAX_CONCURRENT_REQUESTS', '10'))
+
+
+def _headers():
+    return {
         'Content-Type': 'application/json',
         'Authorization': f'Bearer {API_KEY}'
     }
-    payload = json.dumps({
+
+
+def _payload(messages, tokens, stream=False):
+    return {
         "model": MODEL,
         "messages": messages,
-        "temperature": 0.2,
+        "temperature": TEMPERATURE,
         "top_p": 1.0,
         "frequency_penalty": 0.0,
         "presence_penalty": 0.0,
         "max_tokens": tokens,
-        "stream": False
-    })
-    response = requests.post(URL, headers=headers, data=payload)
+        "stream": stream
+    }
+
+
+def _parse_content(data):
+    return data.get("choices", [{}])[0].get("message", {}).get("content", "No response")
+
+
+def _parse_delta(data):
+    return (data.get("choices") or [{}])[0].get("delta", {}).get("content")
+
+
+def _cache_key(messages, tokens):
+    if completion_cache is None:
+        return None
+    return make_cache_key(MODEL, messages, TEMPERATURE, tokens)
+
+
+def _cached(key):
+    return completion_cache.get(key) if key is not None else None
+
+
+def _store(key, content):
+    # Failed calls are reported as "Error: ..." strings and must not be cached
+    if key is not None and content and not content.startswith("Error:"):
+        completion_cache.set(key, content)
+
+
+async def _acached(key):
+    return await completion_cache.aget(key) if key is not None else None
+
+
+async def _astore(key, content):
+    if key is not None and content and not content.startswith("Error:"):
+        await completion_cache.aset(key, content)
+
+
+class AsiOneError(Exception):
+    """Raised when a streamed completion fails."""
+
+
+# Blocking client for scripts and worker threads, keeps connections alive between calls
+_sync_session = requests.Session()
+_sync_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS))
+
+
+def call_asi_one_chatbot(messages, tokens):
+    key = _cache_key(messages, tokens)
+    cached = _cached(key)
+    if cached is not None:
+        return cached
+    try:
+        response = _sync_session.post(
+            URL,
+            headers=_headers(),
+            data=json.dumps(_payload(messages, tokens)),
+            timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT)
+        )
+    except requests.RequestException as e:
+        return f"Error: {type(e).__name__}, {str(e)}"
     if response.status_code == 200:
-        return response.json().get("choices", [{}])[0].get("message", {}).get("content", "No response")
+        content = _parse_content(response.json())
+        _store(key, content)
+        return content
     else:
-        return f"Error: {response.status_code}, {response.text}"
\ No newline at end of file
+        return f"Error: {response.status_code}, {response.text}"
+
+
+class AsiOneClient:
+    """
+    Async ASI One client sharing one keep-alive connection pool.
+
+    The aiohttp session and the concurrency semaphore are bound to the event
+    loop that first uses them and are recreated if the loop changes.
+    """
+
+    def __init__(self, max_connections: int = MAX_CONNECTIONS, max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS):
+        self.max_connections = max_connections
+        self.max_concurrent_requests = max_concurrent_requests
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=KEEPALIVE_TIMEOUT
+            )
+            timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=_headers())
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+            self._loop = loop
+        return self._session
+
+    async def complete(self, messages, tokens) -> str:
+        session = self._get_session()
+        async with self._semaphore:
+            try:
+                async with session.post(URL, data=json.dumps(_payload(messages, tokens))) as response:
+                    if response.status == 200:
+                        return _parse_content(await response.json())
+                    return f"Error: {response.status}, {await response.text()}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"ASI One request failed: {type(e).__name__}, {str(e)}")
+                return f"Error: {type(e).__name__}, {str(e)}"
+
+    async def stream(self, messages, tokens):
+        """Yield the completion's content as it is generated."""
+        session = self._get_session()
+        async with self._semaphore:
+            try:
+                async with session.post(URL, data=json.dumps(_payload(messages, tokens, stream=True))) as response:
+                    if response.status != 200:
+                        raise AsiOneError(f"{response.status}, {await response.text()}")
+                    # Server-sent events, one "data: {...}" line per chunk
+                    async for raw_line in response.content:
+                        line = raw_line.decode('utf-8').strip()
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            content = _parse_delta(json.loads(data))
+                        except json.JSONDecodeError:
+                            logger.warning(f"Skipping malformed stream chunk: {data}")
+                            continue
+                        if content:
+                            yield content
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise AsiOneError(f"{type(e).__name__}, {str(e)}") from e
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+asi_one_client = AsiOneClient()
+
+
+async def acall_asi_one_chatbot(messages, tokens):
+    """Async variant of call_asi_one_chatbot using the shared connection pool."""
+    key = _cache_key(messages, tokens)
+    cached = await _acached(key)
+    if cached is not None:
+        return cached
+    content = await asi_one_client.complete(messages, tokens)
+    await _astore(key, content)
+    return content
+
+
+async def astream_asi_one_chatbot(messages, tokens):
+    """Stream a completion token by token using the shared connection pool."""
+    key = _cache_key(messages, tokens)
+    cached = await _acached(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    async for content in asi_one_client.stream(messages, tokens):
+        parts.append(content)
+        yield content
+    await _astore(key, "".join(parts))
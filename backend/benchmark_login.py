@@ -0,0 +1,102 @@
+"""
+Login storm benchmark against a running API.
+
+Registers (or reuses) a test patient, then fires concurrent logins for a fixed
+duration while probing an unrelated endpoint at a steady rate. Reports logins/sec
+and the latency percentiles of the probe, which should stay flat as long as
+password hashing is kept off the event loop.
+
+    python benchmark_login.py --url http://localhost:8000 --concurrency 50 --duration 20
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+import aiohttp
+
+TEST_EMAIL = "login-benchmark@example.com"
+TEST_PASSWORD = "login-benchmark-password"
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def ensure_user(session: aiohttp.ClientSession, url: str):
+    async with session.post(f"{url}/auth/register", json={
+        "first_name": "Login",
+        "last_name": "Benchmark",
+        "email": TEST_EMAIL,
+        "password": TEST_PASSWORD,
+        "role": "patient"
+    }) as response:
+        # 400 means the user is already registered
+        if response.status not in (201, 400):
+            raise RuntimeError(f"Could not register benchmark user: {response.status} {await response.text()}")
+
+
+async def login_worker(session: aiohttp.ClientSession, url: str, deadline: float, results: dict):
+    form = {"username": TEST_EMAIL, "password": TEST_PASSWORD}
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        async with session.post(f"{url}/auth/token", data=form) as response:
+            await response.read()
+            key = "ok" if response.status == 200 else f"status_{response.status}"
+        results[key] = results.get(key, 0) + 1
+        results["latencies"].append((time.perf_counter() - started) * 1000)
+
+
+async def probe(session: aiohttp.ClientSession, url: str, path: str, deadline: float, interval: float, latencies: List[float]):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        async with session.get(f"{url}{path}") as response:
+            await response.read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+
+
+async def measure_probe(session: aiohttp.ClientSession, args, duration: float) -> List[float]:
+    latencies: List[float] = []
+    await probe(session, args.url, args.probe_path, time.perf_counter() + duration, args.probe_interval, latencies)
+    return latencies
+
+
+async def run(args):
+    connector = aiohttp.TCPConnector(limit=args.concurrency + 5)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await ensure_user(session, args.url)
+
+        baseline = await measure_probe(session, args, min(5.0, args.duration))
+
+        results = {"latencies": []}
+        probe_latencies: List[float] = []
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+        await asyncio.gather(
+            probe(session, args.url, args.probe_path, deadline, args.probe_interval, probe_latencies),
+            *(login_worker(session, args.url, deadline, results) for _ in range(args.concurrency))
+        )
+        elapsed = time.perf_counter() - started
+
+    logins = results.pop("latencies")
+    print(f"Logins: {results.get('ok', 0)} ok in {elapsed:.1f}s = {results.get('ok', 0) / elapsed:.1f}/s")
+    for key, count in sorted(results.items()):
+        if key != "ok":
+            print(f"  {key}: {count}")
+    print(f"Login latency ms: p50 {percentile(logins, 0.5):.1f}, p99 {percentile(logins, 0.99):.1f}")
+    print(f"{args.probe_path} latency ms, idle:  p50 {percentile(baseline, 0.5):.1f}, p99 {percentile(baseline, 0.99):.1f}")
+    print(f"{args.probe_path} latency ms, storm: p50 {percentile(probe_latencies, 0.5):.1f}, p99 {percentile(probe_latencies, 0.99):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure login throughput and its impact on other endpoints")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent login loops")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of login storm")
+    parser.add_argument("--probe-path", default="/metrics", help="unrelated endpoint to time during the storm")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="seconds between probe requests")
+    asyncio.run(run(parser.parse_args()))
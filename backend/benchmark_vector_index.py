@@ -0,0 +1,81 @@
+"""
+Search latency benchmark for the in-memory chunk index.
+
+Builds indexes of synthetic chunks (about --features distinct words each, drawn
+from a Zipf-like vocabulary) and times ChunkIndex.search with short queries.
+Exits with status 1 when the median latency at any size misses the target.
+
+    python benchmark_vector_index.py --sizes 1000 2000 5000 --target-ms 1.0
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from typing import List
+
+from vector_index import ChunkIndex, vectorize
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def make_vocabulary(size: int) -> List[str]:
+    return [f"term{i}" for i in range(size)]
+
+
+def sample_words(rng: random.Random, vocabulary: List[str], weights: List[float], count: int) -> List[str]:
+    return rng.choices(vocabulary, weights=weights, k=count)
+
+
+def build_index(rng: random.Random, vocabulary: List[str], weights: List[float], chunks: int, features: int) -> ChunkIndex:
+    index = ChunkIndex()
+    rows = []
+    for chunk_id in range(chunks):
+        text = " ".join(sample_words(rng, vocabulary, weights, features))
+        indices, vector = vectorize(text)
+        rows.append((chunk_id, chunk_id // 20, features, indices, vector))
+    index.add(rows)
+    return index
+
+
+def run(args) -> bool:
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary)
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    queries = [" ".join(sample_words(rng, vocabulary, weights, args.query_words)) for _ in range(args.queries)]
+
+    passed = True
+    for size in args.sizes:
+        index = build_index(rng, vocabulary, weights, size, args.features)
+        for query in queries[:10]:
+            index.search(query, args.top_k)
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, args.top_k)
+            latencies.append((time.perf_counter() - started) * 1000)
+        p50 = statistics.median(latencies)
+        ok = p50 <= args.target_ms
+        passed = passed and ok
+        print(
+            f"{size} chunks, {len(index.indices)} stored features: "
+            f"p50 {p50:.3f} ms, p99 {percentile(latencies, 0.99):.3f} ms "
+            f"[{'ok' if ok else 'over target'}]"
+        )
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure ChunkIndex.search latency against a target")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 5000], help="chunks per index")
+    parser.add_argument("--features", type=int, default=150, help="words per chunk")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--query-words", type=int, default=8)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--target-ms", type=float, default=1.0, help="maximum median search latency")
+    parser.add_argument("--seed", type=int, default=0)
+    sys.exit(0 if run(parser.parse_args()) else 1)
@@ -0,0 +1,110 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from asi_mini import acall_asi_one_chatbot
+from models import Conversation, Message
+from prompts import PROMPT_TO_SUMMARIZE_CONVERSATION
+
+logger = logging.getLogger(__name__)
+
+# Messages always sent verbatim, newest first, as long as they fit in the budget
+RECENT_MESSAGES = int(os.getenv("CHAT_RECENT_MESSAGES", "8"))
+# Token budget for the verbatim part of the history
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000"))
+# Messages pushed out of the window are only folded into the summary once this many
+# have piled up (or they exceed the budget), so most turns make no summary call
+SUMMARY_FOLD_MESSAGES = int(os.getenv("CHAT_SUMMARY_FOLD_MESSAGES", str(max(1, RECENT_MESSAGES // 2))))
+SUMMARY_MAX_TOKENS = 400
+
+# Keys used in Conversation.context
+SUMMARY_KEY = "history_summary"
+SUMMARIZED_UNTIL_KEY = "history_summarized_until"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def format_message(message: Message) -> Dict[str, str]:
+    return {"role": "user" if message.patient_id else "assistant", "content": message.content}
+
+
+def load_context(conversation: Conversation) -> Dict[str, Any]:
+    # A copy, so that assigning the updated context back registers as a change
+    context = conversation.context
+    return dict(context) if isinstance(context, dict) else {}
+
+
+async def summarize_messages(previous_summary: Optional[str], messages: List[Message]) -> Optional[str]:
+    """Fold messages into the running summary. Returns None if the model call failed."""
+    transcript = "\n".join(
+        f"{'Patient' if msg.patient_id else 'Assistant'}: {msg.content}" for msg in messages
+    )
+    response = await acall_asi_one_chatbot([
+        PROMPT_TO_SUMMARIZE_CONVERSATION,
+        {"role": "user", "content": f"Previous summary:\n{previous_summary or ''}\n\nNew messages:\n{transcript}"}
+    ], SUMMARY_MAX_TOKENS)
+    if response.startswith("Error:"):
+        logger.error(f"Failed to summarize conversation history: {response}")
+        return None
+    return response
+
+
+async def build_history(db: AsyncSession, conversation: Conversation) -> List[Dict[str, str]]:
+    """
+    Return the conversation history to send to the model.
+
+    The most recent messages are kept verbatim within HISTORY_TOKEN_BUDGET. Older
+    messages are folded into a rolling summary stored on Conversation.context,
+    so each message is summarized once and only the unsummarized tail is loaded.
+    Folding happens in batches of SUMMARY_FOLD_MESSAGES; until a batch is full the
+    messages that left the window are still sent verbatim.
+    """
+    context = load_context(conversation)
+    summary = context.get(SUMMARY_KEY)
+    summarized_until = context.get(SUMMARIZED_UNTIL_KEY, 0)
+
+    messages = (await db.execute(
+        select(Message)
+        .where(Message.conversation_id == conversation.id, Message.id > summarized_until)
+        .order_by(Message.timestamp.asc(), Message.id.asc())
+    )).scalars().all()
+
+    # Walk back from the newest message until the window or the budget is full
+    recent = []
+    used_tokens = 0
+    for message in reversed(messages):
+        tokens = estimate_tokens(message.content or "")
+        if len(recent) >= RECENT_MESSAGES or (recent and used_tokens + tokens > HISTORY_TOKEN_BUDGET):
+            break
+        recent.append(message)
+        used_tokens += tokens
+    recent.reverse()
+    overflow = messages[:len(messages) - len(recent)]
+
+    overflow_tokens = sum(estimate_tokens(message.content or "") for message in overflow)
+    if overflow and len(overflow) < SUMMARY_FOLD_MESSAGES and overflow_tokens <= HISTORY_TOKEN_BUDGET:
+        # Not worth a model call yet, keep them verbatim
+        recent = overflow + recent
+        overflow = []
+
+    if overflow:
+        new_summary = await summarize_messages(summary, overflow)
+        if new_summary is not None:
+            summary = new_summary
+            context[SUMMARY_KEY] = summary
+            context[SUMMARIZED_UNTIL_KEY] = overflow[-1].id
+            conversation.context = context
+            await db.commit()
+        # On failure the overflow is retried on the next turn and left out of this prompt
+
+    history = []
+    if summary:
+        history.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+    history.extend(format_message(message) for message in recent)
+    return history
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from asi_mini import acall_asi_one_chatbot
+from models import Document
+from prompts import PROMPT_TO_ANSWER_FROM_PDF, PROMPT_TO_ANSWER_FROM_PDF_VERSION
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_MAX_TOKENS = 1000
+# Maximum number of document summaries generated at the same time by this worker
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+
+_summary_slots = asyncio.Semaphore(SUMMARY_MAX_CONCURRENCY)
+# Summaries being generated, keyed by (document id, prompt version)
+_in_flight: Dict[Tuple[int, str], "asyncio.Future[Optional[str]]"] = {}
+
+
+def compute_content_hash(text: str) -> str:
+    """Return the sha256 hex digest of a document's extracted text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def is_summary_current(document: Document, content_hash: Optional[str] = None) -> bool:
+    """Check whether the stored summary was produced by the current prompt (and text, if given)."""
+    if not document.summary or document.summary_prompt_version != PROMPT_TO_ANSWER_FROM_PDF_VERSION:
+        return False
+    return content_hash is None or document.content_hash == content_hash
+
+
+async def generate_summary(text: str) -> Optional[str]:
+    """Interpret a document's text with the LLM. Returns None if the model call failed."""
+    response = await acall_asi_one_chatbot([
+        PROMPT_TO_ANSWER_FROM_PDF,
+        {"role": "user", "content": text}
+    ], SUMMARY_MAX_TOKENS)
+    if response.startswith("Error:"):
+        logger.error(f"Failed to summarize document: {response}")
+        return None
+    return response
+
+
+async def _generate_bounded(text: str) -> Optional[str]:
+    async with _summary_slots:
+        return await generate_summary(text)
+
+
+async def summarize_document_text(document_id: int, text: str) -> Optional[str]:
+    """
+    Summarize a document's text, sharing the result with every concurrent
+    request for the same document and prompt version.
+    """
+    key = (document_id, PROMPT_TO_ANSWER_FROM_PDF_VERSION)
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_generate_bounded(text))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # Shielded so that one cancelled request doesn't cancel the call for the others
+    return await asyncio.shield(task)
+
+
+def apply_summary(document: Document, content_hash: str, summary: Optional[str]):
+    """Set the summary fields of a document. The caller commits."""
+    document.content_hash = content_hash
+    if summary is not None:
+        document.summary = summary
+        document.summary_prompt_version = PROMPT_TO_ANSWER_FROM_PDF_VERSION
+    document.updated_at = datetime.utcnow()
+
+
+async def store_document_summary(db: AsyncSession, document: Document, text: str) -> Document:
+    """
+    Persist the summary of a document, regenerating it only when the text
+    or the prompt version changed since it was last computed.
+    """
+    content_hash = compute_content_hash(text)
+    if is_summary_current(document, content_hash):
+        return document
+
+    # The same text may already have been summarized for this user (e.g. a re-upload)
+    duplicate = (await db.execute(
+        select(Document)
+        .where(
+            Document.user_id == document.user_id,
+            Document.content_hash == content_hash,
+            Document.summary_prompt_version == PROMPT_TO_ANSWER_FROM_PDF_VERSION,
+            Document.summary.isnot(None),
+            Document.id != document.id
+        )
+        .limit(1)
+    )).scalars().first()
+    summary = duplicate.summary if duplicate else await summarize_document_text(document.id, text)
+
+    apply_summary(document, content_hash, summary)
+    await db.commit()
+    await db.refresh(document)
+    return document
+
+
+async def _refresh_summary(document_id: int, text_path: str, load_text: Callable[[str], Optional[str]]):
+    text = await asyncio.to_thread(load_text, text_path)
+    if not text:
+        return None
+    return text, await summarize_document_text(document_id, text)
+
+
+async def get_document_summaries(db: AsyncSession, user_id: int, load_text: Callable[[str], Optional[str]]) -> List[str]:
+    """
+    Return the stored summaries of all documents of a user.
+
+    Documents whose summary is missing or was produced by an older prompt are
+    summarized again concurrently, loading their text through `load_text`.
+    """
+    documents = (await db.execute(
+        select(Document)
+        .where(Document.user_id == user_id)
+        .order_by(Document.created_at.asc())
+    )).scalars().all()
+    stale = [document for document in documents if not is_summary_current(document) and document.text_path]
+    if stale:
+        results = await asyncio.gather(
+            *(_refresh_summary(document.id, document.text_path, load_text) for document in stale),
+            return_exceptions=True
+        )
+        # Results are written sequentially, the session is never shared between tasks
+        for document, result in zip(stale, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to refresh summary of document {document.id}: {str(result)}")
+            elif result is not None:
+                text, summary = result
+                apply_summary(document, compute_content_hash(text), summary)
+        await db.commit()
+    return [document.summary for document in documents if document.summary]
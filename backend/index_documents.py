@@ -0,0 +1,35 @@
+from database import SessionLocal
+from models import Document, User
+from routers.upload_docs import uploader
+
+def index_documents():
+    """Record documents that exist in storage but not in the documents table."""
+    db = SessionLocal()
+    created = 0
+    try:
+        known_keys = {key for (key,) in db.query(Document.storage_key).filter(Document.storage_key.isnot(None))}
+        for (user_id,) in db.query(User.id).all():
+            for stored in uploader.list_storage_documents(f"user_{user_id}"):
+                if stored['storage_key'] in known_keys:
+                    continue
+                original_path = stored['original_file']
+                db.add(Document(
+                    url=original_path or stored['text_file'],
+                    user_id=user_id,
+                    storage_key=stored['storage_key'],
+                    filename=original_path.rsplit('/', 1)[-1] if original_path else None,
+                    mime_type=stored.get('mime_type'),
+                    size_bytes=stored.get('size_bytes'),
+                    original_path=original_path,
+                    text_path=stored['text_file'],
+                    status="ready"
+                ))
+                created += 1
+            db.commit()
+    finally:
+        db.close()
+    return created
+
+if __name__ == "__main__":
+    created = index_documents()
+    print(f"Indexed {created} documents. Their summaries are generated on the next chat turn.")
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, select, update
+
+from database import AsyncSessionLocal
+from document_summaries import store_document_summary
+from models import Document
+from pdf_text import extract_text_parallel
+from retrieval import index_document_chunks
+
+logger = logging.getLogger(__name__)
+
+# Number of documents processed at the same time by this worker
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+# Processes used for the CPU-bound PDF parsing
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", str(os.cpu_count() or 1)))
+# Jobs waiting beyond this limit are rejected with 503
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "100"))
+# A document left "processing" this long is assumed abandoned by a stopped worker
+INGESTION_STALE_SECONDS = int(os.getenv("INGESTION_STALE_SECONDS", "900"))
+
+
+class IngestionJob:
+    """A stored document waiting for text extraction and summarization."""
+
+    def __init__(self, document_id: int, document_folder: str, original_name: str, file_content: Optional[bytes] = None, claimed: bool = False):
+        self.document_id = document_id
+        self.document_folder = document_folder
+        self.original_name = original_name
+        # Read back from storage when not given
+        self.file_content = file_content
+        # Whether the document row was already switched to "processing" for this job
+        self.claimed = claimed
+
+
+class IngestionQueue:
+    """
+    In-process queue of uploaded documents.
+
+    A few asyncio workers take jobs from the queue. PDF parsing runs on a
+    process pool, storage calls on threads and summaries on the async LLM client.
+    """
+
+    def __init__(self, uploader, workers: int = INGESTION_WORKERS, processes: int = EXTRACTION_PROCESSES, max_size: int = INGESTION_QUEUE_SIZE):
+        self.uploader = uploader
+        self.workers = workers
+        self.processes = processes
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        await self._requeue_unfinished()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def ensure_capacity(self):
+        """Raise 503 if a job could not be queued right now."""
+        if self._queue is None:
+            raise HTTPException(status_code=503, detail="Document processing is not running")
+        if self._queue.full():
+            raise HTTPException(status_code=503, detail="Too many documents being processed, try again later")
+
+    def enqueue(self, job: IngestionJob):
+        self.ensure_capacity()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Too many documents being processed, try again later")
+
+    async def _requeue_unfinished(self):
+        """
+        Queue documents left pending, or processing by a worker that stopped.
+        Every worker runs this at startup; the rows are claimed in one UPDATE
+        skipping rows locked by another worker, so each document is taken once.
+        """
+        try:
+            async with AsyncSessionLocal() as db:
+                now = datetime.utcnow()
+                claimable = (
+                    select(Document.id)
+                    .where(
+                        Document.original_path.isnot(None),
+                        or_(
+                            Document.status == "pending",
+                            and_(
+                                Document.status == "processing",
+                                Document.updated_at < now - timedelta(seconds=INGESTION_STALE_SECONDS)
+                            )
+                        )
+                    )
+                    .order_by(Document.id.asc())
+                    .limit(self.max_size)
+                    .with_for_update(skip_locked=True)
+                )
+                claimed = (await db.execute(
+                    update(Document)
+                    .where(Document.id.in_(claimable))
+                    .values(status="processing", updated_at=now)
+                    .returning(Document.id, Document.original_path)
+                    .execution_options(synchronize_session=False)
+                )).all()
+                await db.commit()
+            for document_id, original_path in sorted(claimed):
+                folder, filename = original_path.rsplit("/", 1)
+                self._queue.put_nowait(IngestionJob(
+                    document_id=document_id,
+                    document_folder=folder,
+                    original_name=os.path.splitext(filename)[0],
+                    claimed=True
+                ))
+            if claimed:
+                logger.info(f"Requeued {len(claimed)} unfinished documents")
+        except Exception as e:
+            logger.error(f"Failed to requeue unfinished documents: {str(e)}")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.process(job)
+            except Exception as e:
+                logger.error(f"Ingestion of document {job.document_id} failed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def process(self, job: IngestionJob):
+        async with AsyncSessionLocal() as db:
+            if not job.claimed:
+                claim = await db.execute(
+                    update(Document)
+                    .where(Document.id == job.document_id, Document.status == "pending")
+                    .values(status="processing", updated_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+                if claim.rowcount == 0:
+                    # Deleted, or requeued by another worker that started meanwhile
+                    return
+            document = await db.get(Document, job.document_id)
+            if document is None:
+                return
+
+            try:
+                extracted_text = None
+                if document.text_path:
+                    # Text stored by an interrupted run, no need to parse the PDF again
+                    extracted_text = await asyncio.to_thread(self.uploader.download_text, document.text_path)
+                if extracted_text is None:
+                    file_content = job.file_content
+                    if file_content is None:
+                        file_content = await asyncio.to_thread(self.uploader.download, document.original_path)
+
+                    extracted_text = await extract_text_parallel(file_content, self._executor)
+                    # Release the upload as soon as it has been parsed
+                    job.file_content = file_content = None
+
+                    document.text_path = await asyncio.to_thread(
+                        self.uploader.store_text, job.document_folder, job.original_name, extracted_text
+                    )
+                document.text_length = len(extracted_text)
+                await index_document_chunks(db, document, extracted_text)
+                await db.commit()
+
+                await store_document_summary(db, document, extracted_text)
+                # A failed summary is retried on the next chat turn, the text is usable already
+                document.status = "ready"
+                document.error = None
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                document.status = "failed"
+                document.error = getattr(e, "detail", None) or str(e)
+                await db.commit()
+                raise
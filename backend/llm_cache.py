@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from metrics import register_metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+MEMORY_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_MAX_ENTRIES", "1024"))
+# Set to an empty string to keep the cache in memory only
+DISK_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(__file__), "llm_cache.sqlite3"))
+DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "50000"))
+# The disk tier is trimmed once every this many writes rather than on each one
+DISK_EVICT_EVERY = int(os.getenv("LLM_CACHE_DISK_EVICT_EVERY", "100"))
+
+
+def make_cache_key(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    """Canonical hash of everything that determines a completion."""
+    canonical = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """Thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """Persistent tier shared by all workers on the host, evicting least recently used rows."""
+
+    def __init__(self, path: str, max_entries: int, evict_every: int = DISK_EVICT_EVERY):
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_completions_last_access ON completions (last_access)")
+
+    def get(self, key: str) -> Optional[tuple]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            return row
+
+    def set(self, key: str, value: str, expires_at: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now)
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+        count = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+
+class CompletionCache:
+    """Two-tier completion cache: in-process LRU in front of an optional SQLite store."""
+
+    def __init__(self, ttl_seconds: int, memory: MemoryCache, disk: Optional[SQLiteCache] = None):
+        self.ttl_seconds = ttl_seconds
+        self.memory = memory
+        self.disk = disk
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self.disk is not None:
+            try:
+                row = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.error(f"Completion cache read failed: {str(e)}")
+                row = None
+            if row is not None:
+                self.disk_hits += 1
+                self.memory.set(key, row[0], row[1])
+                return row[0]
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl_seconds
+        self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            self._disk_set(key, value, expires_at)
+        self.stores += 1
+
+    def _disk_set(self, key: str, value: str, expires_at: float):
+        try:
+            self.disk.set(key, value, expires_at)
+        except sqlite3.Error as e:
+            logger.error(f"Completion cache write failed: {str(e)}")
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Same as get, with the disk tier read on a worker thread instead of the event loop."""
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self.disk is not None:
+            return await asyncio.to_thread(self.get, key)
+        self.misses += 1
+        return None
+
+    async def aset(self, key: str, value: str):
+        """Same as set, with the disk tier written on a worker thread instead of the event loop."""
+        expires_at = time.time() + self.ttl_seconds
+        self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+        self.stores += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+
+def _create_cache() -> Optional[CompletionCache]:
+    if not CACHE_ENABLED:
+        return None
+    disk = None
+    if DISK_PATH:
+        try:
+            disk = SQLiteCache(DISK_PATH, DISK_MAX_ENTRIES)
+        except sqlite3.Error as e:
+            logger.error(f"Could not open completion cache at {DISK_PATH}, using memory only: {str(e)}")
+    return CompletionCache(CACHE_TTL_SECONDS, MemoryCache(MEMORY_MAX_ENTRIES), disk)
+
+
+completion_cache = _create_cache()
+
+if completion_cache is not None:
+    register_metrics("llm_cache", completion_cache.stats)
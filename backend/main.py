@@ -2,8 +2,11 @@ from fastapi import FastAPI, WebSocket
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine
+from database import engine, async_engine
 import models
+from asi_mini import asi_one_client
+from metrics import collect_metrics
+from passwords import password_hasher
 from routers import auth
 from routers import upload_docs
 from routers import patient
@@ -30,6 +33,30 @@ app.add_middleware(
 def root():
     return FileResponse("static/test.html")
 
+@app.get('/metrics')
+def metrics():
+    return collect_metrics()
+
+@app.on_event("startup")
+async def start_ingestion_queue():
+    await upload_docs.ingestion_queue.start()
+
+@app.on_event("shutdown")
+async def close_asi_one_client():
+    await asi_one_client.close()
+
+@app.on_event("shutdown")
+async def stop_ingestion_queue():
+    await upload_docs.ingestion_queue.stop()
+
+@app.on_event("shutdown")
+async def dispose_database_engine():
+    await async_engine.dispose()
+
+@app.on_event("shutdown")
+async def stop_password_hasher():
+    password_hasher.shutdown()
+
 app.include_router(auth.router)
 app.include_router(upload_docs.router)
 app.include_router(patient.router)
@@ -0,0 +1,58 @@
+import asyncio
+import os
+from typing import Any, Dict, Set
+
+from dotenv import load_dotenv
+
+from metrics import register_metrics
+
+load_dotenv()
+
+# Longest a client may hold a "messages since" request open
+LONG_POLL_MAX_SECONDS = float(os.getenv("LONG_POLL_MAX_SECONDS", "30"))
+# Waiting requests re-check the database this often, to see messages saved by other workers
+LONG_POLL_INTERVAL_SECONDS = float(os.getenv("LONG_POLL_INTERVAL_SECONDS", "1"))
+
+
+class MessageNotifier:
+    """
+    Wakes requests waiting for new messages in a conversation. Only messages saved
+    by this process notify; waiters also time out every poll interval so they pick
+    up messages saved by other workers from the database.
+    """
+
+    def __init__(self):
+        self._listeners: Dict[int, Set[asyncio.Event]] = {}
+        self.notifications = 0
+        self.wakeups = 0
+
+    def listen(self, conversation_id: int) -> asyncio.Event:
+        """Register before querying, so a message saved meanwhile is not missed."""
+        event = asyncio.Event()
+        self._listeners.setdefault(conversation_id, set()).add(event)
+        return event
+
+    def unlisten(self, conversation_id: int, event: asyncio.Event):
+        listeners = self._listeners.get(conversation_id)
+        if listeners is not None:
+            listeners.discard(event)
+            if not listeners:
+                del self._listeners[conversation_id]
+
+    def notify(self, conversation_id: int):
+        self.notifications += 1
+        for event in self._listeners.get(conversation_id, ()):
+            event.set()
+            self.wakeups += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "waiting": sum(len(listeners) for listeners in self._listeners.values()),
+            "conversations": len(self._listeners),
+            "notifications": self.notifications,
+            "wakeups": self.wakeups,
+        }
+
+
+message_notifier = MessageNotifier()
+register_metrics("message_notifier", message_notifier.stats)
@@ -0,0 +1,13 @@
+from typing import Any, Callable, Dict
+
+# Components register a callable returning their current counters
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], Dict[str, Any]]):
+    """Expose the counters returned by `provider` under `name` on /metrics."""
+    _providers[name] = provider
+
+
+def collect_metrics() -> Dict[str, Dict[str, Any]]:
+    return {name: provider() for name, provider in _providers.items()}
@@ -0,0 +1,24 @@
+"""add chunk vectors
+
+Revision ID: add_chunk_vectors
+Revises: add_document_chunks
+Create Date: 2025-06-07 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_chunk_vectors'
+down_revision = 'add_document_chunks'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Hashed term vectors of each chunk, filled lazily for existing rows
+    op.add_column('document_chunks', sa.Column('vector_indices', sa.LargeBinary(), nullable=True))
+    op.add_column('document_chunks', sa.Column('vector_weights', sa.LargeBinary(), nullable=True))
+
+def downgrade():
+    op.drop_column('document_chunks', 'vector_weights')
+    op.drop_column('document_chunks', 'vector_indices')
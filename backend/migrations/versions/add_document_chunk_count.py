@@ -0,0 +1,27 @@
+"""add chunk count to documents
+
+Revision ID: add_document_chunk_count
+Revises: convert_json_columns_to_jsonb
+Create Date: 2025-06-12 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_document_chunk_count'
+down_revision = 'convert_json_columns_to_jsonb'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('documents', sa.Column('chunk_count', sa.Integer(), nullable=True))
+    # Documents without chunks stay NULL and are chunked once on the next chat turn
+    op.execute(
+        "UPDATE documents SET chunk_count = counts.chunks "
+        "FROM (SELECT document_id, count(*) AS chunks FROM document_chunks GROUP BY document_id) AS counts "
+        "WHERE documents.id = counts.document_id"
+    )
+
+def downgrade():
+    op.drop_column('documents', 'chunk_count')
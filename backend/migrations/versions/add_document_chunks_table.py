@@ -0,0 +1,40 @@
+"""add document chunks table
+
+Revision ID: add_document_chunks
+Revises: add_document_index_fields
+Create Date: 2025-06-06 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_document_chunks'
+down_revision = 'add_document_index_fields'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Create document_chunks table, filled at ingestion for retrieval
+    op.create_table(
+        'document_chunks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('document_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('ordinal', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('token_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_document_chunks_id', 'document_chunks', ['id'])
+    op.create_index('ix_document_chunks_document_id', 'document_chunks', ['document_id'])
+    op.create_index('ix_document_chunks_user_id', 'document_chunks', ['user_id'])
+
+def downgrade():
+    op.drop_index('ix_document_chunks_user_id', table_name='document_chunks')
+    op.drop_index('ix_document_chunks_document_id', table_name='document_chunks')
+    op.drop_index('ix_document_chunks_id', table_name='document_chunks')
+    # Drop document_chunks table
+    op.drop_table('document_chunks')
@@ -0,0 +1,36 @@
+"""add document index fields
+
+Revision ID: add_document_index_fields
+Revises: add_document_status
+Create Date: 2025-06-05 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_document_index_fields'
+down_revision = 'add_document_status'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('documents', sa.Column('storage_key', sa.String(), nullable=True))
+    op.add_column('documents', sa.Column('filename', sa.String(), nullable=True))
+    op.add_column('documents', sa.Column('mime_type', sa.String(), nullable=True))
+    op.add_column('documents', sa.Column('size_bytes', sa.BigInteger(), nullable=True))
+    op.add_column('documents', sa.Column('file_hash', sa.String(length=64), nullable=True))
+    op.add_column('documents', sa.Column('text_length', sa.Integer(), nullable=True))
+    op.create_unique_constraint('uq_documents_storage_key', 'documents', ['storage_key'])
+    # Listings and chat lookups filter on the owner
+    op.create_index('ix_documents_user_id_created_at', 'documents', ['user_id', 'created_at'])
+
+def downgrade():
+    op.drop_index('ix_documents_user_id_created_at', table_name='documents')
+    op.drop_constraint('uq_documents_storage_key', 'documents', type_='unique')
+    op.drop_column('documents', 'text_length')
+    op.drop_column('documents', 'file_hash')
+    op.drop_column('documents', 'size_bytes')
+    op.drop_column('documents', 'mime_type')
+    op.drop_column('documents', 'filename')
+    op.drop_column('documents', 'storage_key')
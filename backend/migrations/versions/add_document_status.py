@@ -0,0 +1,26 @@
+"""add document ingestion status
+
+Revision ID: add_document_status
+Revises: add_doc_summary_fields
+Create Date: 2025-06-04 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_document_status'
+down_revision = 'add_doc_summary_fields'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('documents', sa.Column('original_path', sa.String(), nullable=True))
+    # Existing documents were processed synchronously, so they are ready
+    op.add_column('documents', sa.Column('status', sa.String(), nullable=False, server_default='ready'))
+    op.add_column('documents', sa.Column('error', sa.Text(), nullable=True))
+
+def downgrade():
+    op.drop_column('documents', 'error')
+    op.drop_column('documents', 'status')
+    op.drop_column('documents', 'original_path')
@@ -0,0 +1,26 @@
+"""add document summary fields
+
+Revision ID: add_doc_summary_fields
+Revises: add_documents
+Create Date: 2025-06-02 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_doc_summary_fields'
+down_revision = 'add_documents'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Track where the extracted text lives and which text/prompt produced the summary
+    op.add_column('documents', sa.Column('text_path', sa.String(), nullable=True))
+    op.add_column('documents', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('documents', sa.Column('summary_prompt_version', sa.String(), nullable=True))
+
+def downgrade():
+    op.drop_column('documents', 'summary_prompt_version')
+    op.drop_column('documents', 'content_hash')
+    op.drop_column('documents', 'text_path')
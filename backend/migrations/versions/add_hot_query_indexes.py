@@ -0,0 +1,36 @@
+"""add indexes for conversation, message and appointment lookups
+
+Revision ID: add_hot_query_indexes
+Revises: add_refresh_tokens
+Create Date: 2025-06-10 10:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_hot_query_indexes'
+down_revision = 'add_refresh_tokens'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns), kept in sync with __table_args__ in models.py
+INDEXES = [
+    # Message history of a conversation, in order
+    ('ix_messages_conversation_id_timestamp', 'messages', ['conversation_id', 'timestamp', 'id']),
+    # Conversations of a user, most recently updated first
+    ('ix_conversations_user_id_updated_at', 'conversations', ['user_id', 'updated_at']),
+    # Appointments of a patient or a doctor, by date
+    ('ix_appointments_patient_id_start_time', 'appointments', ['patient_id', 'start_time']),
+    ('ix_appointments_doctor_id_start_time', 'appointments', ['doctor_id', 'start_time']),
+]
+
+def upgrade():
+    # Built concurrently so the tables stay writable, which needs to run outside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,40 @@
+"""add refresh tokens table and user token version
+
+Revision ID: add_refresh_tokens
+Revises: add_revoked_tokens
+Create Date: 2025-06-09 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_refresh_tokens'
+down_revision = 'add_revoked_tokens'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('users', sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+
+    # Create refresh_tokens table, one row per issued refresh token
+    op.create_table(
+        'refresh_tokens',
+        sa.Column('jti', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('family_id', sa.String(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('used_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('jti')
+    )
+    op.create_index('ix_refresh_tokens_user_id', 'refresh_tokens', ['user_id'])
+    op.create_index('ix_refresh_tokens_family_id', 'refresh_tokens', ['family_id'])
+
+def downgrade():
+    op.drop_index('ix_refresh_tokens_family_id', table_name='refresh_tokens')
+    op.drop_index('ix_refresh_tokens_user_id', table_name='refresh_tokens')
+    # Drop refresh_tokens table
+    op.drop_table('refresh_tokens')
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,31 @@
+"""add revoked tokens table
+
+Revision ID: add_revoked_tokens
+Revises: add_chunk_vectors
+Create Date: 2025-06-08 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_revoked_tokens'
+down_revision = 'add_chunk_vectors'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Create revoked_tokens table, shared by all workers for logout
+    op.create_table(
+        'revoked_tokens',
+        sa.Column('jti', sa.String(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('jti')
+    )
+    op.create_index('ix_revoked_tokens_expires_at', 'revoked_tokens', ['expires_at'])
+
+def downgrade():
+    op.drop_index('ix_revoked_tokens_expires_at', table_name='revoked_tokens')
+    # Drop revoked_tokens table
+    op.drop_table('revoked_tokens')
@@ -0,0 +1,117 @@
+"""convert JSON string columns to JSONB
+
+Revision ID: convert_json_columns_to_jsonb
+Revises: add_hot_query_indexes
+Create Date: 2025-06-11 10:00:00.000000
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'convert_json_columns_to_jsonb'
+down_revision = 'add_hot_query_indexes'
+branch_labels = None
+depends_on = None
+
+# (table, column) holding JSON serialized into a string
+COLUMNS = [
+    ('conversations', 'context'),
+    ('messages', 'message_metadata'),
+    ('doctors', 'available_hours'),
+    ('patients', 'medical_history'),
+    ('patients', 'allergies'),
+    ('patients', 'current_medications'),
+]
+
+# Rows converted per statement, each in its own transaction
+BATCH_SIZE = int(os.getenv('JSONB_BACKFILL_BATCH_SIZE', '5000'))
+
+# Text that is not valid JSON (free text typed in a profile) is kept as a JSON string
+CAST_FUNCTION = """
+CREATE OR REPLACE FUNCTION jsonb_backfill_cast(value text) RETURNS jsonb AS $$
+BEGIN
+    IF value IS NULL OR btrim(value) = '' THEN
+        RETURN NULL;
+    END IF;
+    RETURN value::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN to_jsonb(value);
+END
+$$ LANGUAGE plpgsql IMMUTABLE
+"""
+
+def _shadow(column):
+    return f'{column}_jsonb'
+
+def _sync_function(table, column):
+    return f'{table}_{column}_jsonb_sync'
+
+def _backfill(connection, table, column):
+    """Fill the shadow column by primary key ranges, committing after each batch."""
+    low, high = connection.execute(sa.text(f'SELECT min(id), max(id) FROM {table}')).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        connection.execute(
+            sa.text(
+                f'UPDATE {table} SET {_shadow(column)} = jsonb_backfill_cast({column}) '
+                f'WHERE id >= :start AND id < :end AND {column} IS NOT NULL AND {_shadow(column)} IS NULL'
+            ),
+            {'start': start, 'end': start + BATCH_SIZE}
+        )
+
+def upgrade():
+    # 1. Shadow JSONB columns, kept in sync with writes made while the backfill runs
+    op.execute(CAST_FUNCTION)
+    for table, column in COLUMNS:
+        op.add_column(table, sa.Column(_shadow(column), postgresql.JSONB(), nullable=True))
+        op.execute(f"""
+            CREATE FUNCTION {_sync_function(table, column)}() RETURNS trigger AS $$
+            BEGIN
+                NEW.{_shadow(column)} := jsonb_backfill_cast(NEW.{column});
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        op.execute(
+            f'CREATE TRIGGER {_sync_function(table, column)} BEFORE INSERT OR UPDATE OF {column} '
+            f'ON {table} FOR EACH ROW EXECUTE FUNCTION {_sync_function(table, column)}()'
+        )
+
+    # 2. Existing rows in short batches, so no lock is held for long
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        for table, column in COLUMNS:
+            _backfill(connection, table, column)
+
+    # 3. Swap the columns; only this step takes an exclusive lock, and it does not rewrite the tables
+    for table, column in COLUMNS:
+        op.execute(f'DROP TRIGGER {_sync_function(table, column)} ON {table}')
+        op.execute(f'DROP FUNCTION {_sync_function(table, column)}()')
+        op.drop_column(table, column)
+        op.alter_column(table, _shadow(column), new_column_name=column)
+    op.execute('DROP FUNCTION jsonb_backfill_cast(text)')
+
+    # 4. Key lookups on available hours, e.g. doctors available on a weekday
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_doctors_available_hours', 'doctors', ['available_hours'],
+            postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True
+        )
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_doctors_available_hours', table_name='doctors', postgresql_concurrently=True, if_exists=True)
+    # Rewrites the tables; JSON strings go back to their text, everything else to serialized JSON
+    for table, column in reversed(COLUMNS):
+        op.alter_column(
+            table, column,
+            type_=sa.String(),
+            postgresql_using=(
+                f"CASE WHEN jsonb_typeof({column}) = 'string' THEN {column} #>> '{{}}' ELSE {column}::text END"
+            )
+        )
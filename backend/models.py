@@ -1,6 +1,7 @@
 from datetime import datetime, date
 from typing import Optional, List
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Table, Text, Date, text
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Float, ForeignKey, Table, Text, Date, Index, LargeBinary, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -24,6 +25,8 @@ class User(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
     role = Column(String)
+    # Bumped when the active flag or role changes, so refresh tokens issued before stop working
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Add conversations relationship
     conversations = relationship("Conversation", back_populates="user")
@@ -44,9 +47,9 @@ class Patient(User):
     gender = Column(String)
     phone_number = Column(String)
     address = Column(String)
-    medical_history = Column(String)  # Store as JSON string
-    allergies = Column(String)  # Store as JSON string
-    current_medications = Column(String)  # Store as JSON string
+    medical_history = Column(JSONB)
+    allergies = Column(JSONB)
+    current_medications = Column(JSONB)
     emergency_contact = Column(String)
 
     # Relationship with doctors
@@ -71,7 +74,7 @@ class Doctor(User):
     phone_number = Column(String)
     address = Column(String)
     consultation_fee = Column(Float)
-    available_hours = Column(String)  # Store as JSON string
+    available_hours = Column(JSONB)  # {"monday": {"start": "09:00", "end": "17:00"}, ...}
     calendar_id = Column(String, nullable=True)  # Google Calendar ID
 
     # Relationship with patients
@@ -83,6 +86,11 @@ class Doctor(User):
         'polymorphic_identity': 'doctor',
     }
 
+    __table_args__ = (
+        # Serves key lookups such as available_hours ? 'monday'
+        Index("ix_doctors_available_hours", "available_hours", postgresql_using="gin"),
+    )
+
 class Conversation(Base):
     __tablename__ = "conversations"
 
@@ -91,7 +99,7 @@ class Conversation(Base):
     start_time = Column(DateTime, default=datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
     status = Column(String, default="active")  # active, completed, archived
-    context = Column(String, nullable=True)  # Store as JSON string
+    context = Column(JSONB, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -99,6 +107,10 @@ class Conversation(Base):
     user = relationship("User", foreign_keys=[user_id], back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_conversations_user_id_updated_at", "user_id", "updated_at"),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
 
@@ -109,13 +121,17 @@ class Message(Base):
     content = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
     message_type = Column(String, default="text")
-    message_metadata = Column(String, nullable=True)  # Store as JSON string
+    message_metadata = Column(JSONB, nullable=True)
 
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
     parent_message = relationship("Message", remote_side=[id], backref="response")
     patient = relationship("User", foreign_keys=[patient_id])
 
+    __table_args__ = (
+        Index("ix_messages_conversation_id_timestamp", "conversation_id", "timestamp", "id"),
+    )
+
 class Appointment(Base):
     __tablename__ = "appointments"
 
@@ -134,15 +150,71 @@ class Appointment(Base):
     patient = relationship("Patient", back_populates="appointments")
     doctor = relationship("Doctor", back_populates="appointments")
 
+    __table_args__ = (
+        Index("ix_appointments_patient_id_start_time", "patient_id", "start_time"),
+        Index("ix_appointments_doctor_id_start_time", "doctor_id", "start_time"),
+    )
+
 class Document(Base):
     __tablename__ = "documents"
 
     id = Column(Integer, primary_key=True, index=True)
     url = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    storage_key = Column(String, nullable=True, unique=True)  # Document folder in storage
+    filename = Column(String, nullable=True)
+    mime_type = Column(String, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    file_hash = Column(String(64), nullable=True)  # sha256 of the uploaded file
+    original_path = Column(String, nullable=True)  # Storage path of the uploaded file
+    text_path = Column(String, nullable=True)  # Storage path of the extracted text
+    text_length = Column(Integer, nullable=True)
+    status = Column(String, nullable=False, default="ready", server_default="ready")  # pending, processing, ready, failed
+    error = Column(Text, nullable=True)
     summary = Column(Text, nullable=True)
+    content_hash = Column(String(64), nullable=True)  # sha256 of the extracted text
+    summary_prompt_version = Column(String, nullable=True)
+    chunk_count = Column(Integer, nullable=True)  # Set once the text has been chunked for retrieval
     created_at = Column(DateTime, nullable=False, server_default=text("now()"))
     updated_at = Column(DateTime, nullable=False, server_default=text("now()"))
 
     # Relationships
-    user = relationship("User", back_populates="documents") 
\ No newline at end of file
+    user = relationship("User", back_populates="documents")
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_documents_user_id_created_at", "user_id", "created_at"),
+    )
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    ordinal = Column(Integer, nullable=False)  # Position of the chunk in the document
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=False)
+    # Hashed term vector used by vector_index: int32 feature ids and float32 weights
+    vector_indices = Column(LargeBinary, nullable=True)
+    vector_weights = Column(LargeBinary, nullable=True)
+
+    # Relationships
+    document = relationship("Document", back_populates="chunks")
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)  # Token id claim
+    expires_at = Column(DateTime, nullable=False, index=True)  # Row can be purged once the token expired
+    revoked_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    jti = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    family_id = Column(String, nullable=False, index=True)  # Shared by every token rotated from the same login
+    expires_at = Column(DateTime, nullable=False)
+    used_at = Column(DateTime, nullable=True)  # Set when rotated or revoked; a second use revokes the family
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
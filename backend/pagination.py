@@ -0,0 +1,30 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Query
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Page size query parameter shared by the paginated listings
+PageSize = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+
+
+def encode_cursor(position: datetime, row_id: int) -> str:
+    """Opaque cursor pointing just past the row at (`position`, `row_id`) in a keyset ordering."""
+    raw = json.dumps([position.isoformat(), row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Return the (position, id) of a cursor made by encode_cursor, or None without one."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position, row_id = json.loads(raw)
+        return datetime.fromisoformat(position), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from dotenv import load_dotenv
+
+from metrics import register_metrics
+
+load_dotenv()
+
+# bcrypt cost factor. Hashes with a different cost are rehashed on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads doing password work; bcrypt releases the GIL, so this is the number of hashes in parallel
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hashes allowed to wait for a thread before requests are turned away with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated thread pool so it never blocks the event loop,
+    and bounds the number of queued hashes so a login storm cannot build an
+    unbounded backlog.
+    """
+
+    def __init__(self, context: CryptContext, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.context = context
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.hashes = 0
+        self.verifications = 0
+        self.rehashes = 0
+        self.rejected = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, function, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many login attempts in progress, please retry shortly",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        self.hashes += 1
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Check `password` against `hashed_password`. Returns (valid, new_hash), where
+        new_hash is set when the stored hash does not match the current policy.
+        """
+        self.verifications += 1
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed_password)
+        if new_hash is not None:
+            self.rehashes += 1
+        return valid, new_hash
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rounds": BCRYPT_ROUNDS,
+            "workers": self.workers,
+            "pending": self._pending,
+            "hashes": self.hashes,
+            "verifications": self.verifications,
+            "rehashes": self.rehashes,
+            "rejected": self.rejected,
+        }
+
+
+password_hasher = PasswordHasher(pwd_context)
+register_metrics("password_hashing", password_hasher.stats)
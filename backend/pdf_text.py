@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import Executor
+from typing import Iterator, List, Optional, Tuple, Union
+
+import fitz
+
+logger = logging.getLogger(__name__)
+
+# Documents longer than this are split into page ranges parsed in parallel
+PAGES_PER_CHUNK = int(os.getenv("PDF_PAGES_PER_CHUNK", "20"))
+
+
+def open_pdf(data: Union[bytes, str]) -> fitz.Document:
+    """Open a PDF straight from memory, or from a file when given its path."""
+    if isinstance(data, str):
+        return fitz.open(data, filetype="pdf")
+    return fitz.open(stream=data, filetype="pdf")
+
+
+def count_pages(data: Union[bytes, str]) -> int:
+    with open_pdf(data) as doc:
+        return doc.page_count
+
+
+def iter_page_texts(data: Union[bytes, str], start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """Yield the text of each page in [start, stop)."""
+    with open_pdf(data) as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        for number in range(start, stop):
+            yield doc.load_page(number).get_text()
+
+
+def extract_text(data: Union[bytes, str], start: int = 0, stop: Optional[int] = None) -> str:
+    """Extract the text of a PDF (or of a page range) in a single join."""
+    return "".join(iter_page_texts(data, start, stop))
+
+
+def extract_text_timed(data: Union[bytes, str], start: int = 0, stop: Optional[int] = None) -> Tuple[str, List[float]]:
+    """Like extract_text, also returning the time spent on each page in milliseconds."""
+    pages = []
+    timings = []
+    started = time.perf_counter()
+    for text in iter_page_texts(data, start, stop):
+        finished = time.perf_counter()
+        pages.append(text)
+        timings.append((finished - started) * 1000)
+        started = finished
+    return "".join(pages), timings
+
+
+def page_ranges(page_count: int, pages_per_chunk: int = PAGES_PER_CHUNK) -> List[Tuple[int, int]]:
+    return [(start, min(start + pages_per_chunk, page_count)) for start in range(0, page_count, pages_per_chunk)]
+
+
+def _spool(data: bytes) -> str:
+    fd, path = tempfile.mkstemp(prefix="pdf-", suffix=".pdf")
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    return path
+
+
+async def extract_text_parallel(data: bytes, executor: Executor, pages_per_chunk: int = PAGES_PER_CHUNK) -> str:
+    """
+    Extract the text of a PDF on `executor` (usually a process pool), splitting
+    documents longer than `pages_per_chunk` into page ranges parsed concurrently.
+    """
+    loop = asyncio.get_running_loop()
+    # Workers open the document from a spooled file instead of each being sent a pickled copy
+    path = await asyncio.to_thread(_spool, data)
+    try:
+        page_count = await asyncio.to_thread(count_pages, path)
+        results = await asyncio.gather(*(
+            loop.run_in_executor(executor, extract_text_timed, path, start, stop)
+            for start, stop in page_ranges(page_count, pages_per_chunk)
+        ))
+    finally:
+        os.unlink(path)
+
+    timings = [timing for _, chunk_timings in results for timing in chunk_timings]
+    if timings:
+        logger.debug(
+            f"Extracted {page_count} pages: {sum(timings):.1f} ms CPU, "
+            f"{sum(timings) / len(timings):.1f} ms/page, slowest page {max(timings):.1f} ms"
+        )
+    return "".join(text for text, _ in results)
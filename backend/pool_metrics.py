@@ -0,0 +1,108 @@
+import threading
+import time
+from typing import Any, Dict, Type
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool
+
+
+class PoolStats:
+    """Counters of a connection pool, kept across pool re-creation (engine.dispose())."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def snapshot(self, pool: Pool) -> Dict[str, Any]:
+        stats = {
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "closes": self.closes,
+            "invalidations": self.invalidations,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds, 6),
+            "wait_seconds_avg": round(self.wait_seconds / self.waits, 6) if self.waits else 0.0,
+            "wait_seconds_max": round(self.max_wait_seconds, 6),
+        }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+            })
+        return stats
+
+
+def instrumented_pool(pool_class: Type[QueuePool], stats: PoolStats) -> Type[QueuePool]:
+    """
+    Return a subclass of `pool_class` timing checkouts into `stats`. A checkout counts
+    as a wait when every connection, overflow included, is in use at the time it starts.
+    The other counters come from track_pool_events.
+    """
+
+    class InstrumentedPool(pool_class):
+        def _do_get(self):
+            exhausted = self._max_overflow >= 0 and self.checkedout() >= self.size() + self._max_overflow
+            if not exhausted:
+                return super()._do_get()
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                stats.timeouts += 1
+                raise
+            finally:
+                stats.record_wait(time.perf_counter() - started)
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_class.__name__}"
+    return InstrumentedPool
+
+
+def track_pool_events(engine: Engine, stats: PoolStats):
+    """
+    Count pool events of `engine` into `stats`. Listeners are registered on the engine,
+    not on the pool class (which fails for the asyncio pools), so pools re-created by
+    dispose() keep exactly one set.
+    """
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.checkouts += 1
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        stats.checkins += 1
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        stats.connects += 1
+
+    @event.listens_for(engine, "close")
+    def _close(dbapi_connection, connection_record):
+        stats.closes += 1
+
+    @event.listens_for(engine, "close_detached")
+    def _close_detached(dbapi_connection):
+        stats.closes += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _invalidate(dbapi_connection, connection_record, exception):
+        stats.invalidations += 1
@@ -27,6 +27,9 @@ Always stay empathetic, clear, and supportive. Do not offer diagnoses or medical
 """
 }
 
+# Bump whenever PROMPT_TO_ANSWER_FROM_PDF changes so stored document summaries get regenerated
+PROMPT_TO_ANSWER_FROM_PDF_VERSION = "1"
+
 PROMPT_TO_ANSWER_FROM_PDF = {
     "role":"system",
     "content":
@@ -69,4 +72,20 @@ Do not rely on user messages or questions — respond based solely on the conten
 DOCUMENT_DIAGNOSIS = {
     "role":"user",
     "content": """This is my recent diagnosis. Please take it in to account: """
-}
\ No newline at end of file
+}
+
+PROMPT_TO_SUMMARIZE_CONVERSATION = {
+    "role": "system",
+    "content": """You maintain a running summary of a conversation between a patient and OncoGuide, an assistant that screens for early signs of breast cancer.
+
+You receive the previous summary (possibly empty) followed by the newer messages. Return an updated summary that:
+
+    Keeps every answer the patient gave to the screening questions, and which questions are still unanswered.
+
+    Keeps symptoms, family history, documents and concerns the patient mentioned, and any recommendation already given.
+
+    Drops greetings, repetitions and small talk.
+
+Write it in the third person, in plain sentences, under 200 words. Return only the summary.
+"""
+}
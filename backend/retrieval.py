@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import re
+from typing import Callable, List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from conversation_context import estimate_tokens
+from models import Document, DocumentChunk
+from vector_index import pack_vector, vector_indexes, vectorize
+
+logger = logging.getLogger(__name__)
+
+# Target size of a chunk and overlap between consecutive chunks, in tokens
+CHUNK_TOKENS = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP_TOKENS", "30"))
+# Passages added to a chat prompt
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "800"))
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _split_long(paragraph: str, max_tokens: int) -> List[str]:
+    """Split a paragraph larger than a chunk on sentences, then on words."""
+    pieces = []
+    for sentence in _SENTENCE_RE.split(paragraph):
+        if estimate_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words = sentence.split()
+        step = max(1, max_tokens * 4 // 6)  # about six characters per word
+        pieces.extend(" ".join(words[start:start + step]) for start in range(0, len(words), step))
+    return pieces
+
+
+def split_into_chunks(text: str, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """
+    Pack paragraphs into chunks of about `max_tokens`, repeating the tail of
+    each chunk at the start of the next one so passages keep their context.
+    """
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if paragraph:
+            pieces.extend(_split_long(paragraph, max_tokens))
+
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(" ".join(current))
+            # Carry the last pieces over as overlap
+            overlap: List[str] = []
+            overlap_size = 0
+            for previous in reversed(current):
+                overlap_size += estimate_tokens(previous)
+                if overlap_size > overlap_tokens:
+                    break
+                overlap.insert(0, previous)
+            current = overlap
+            current_tokens = sum(estimate_tokens(previous) for previous in current)
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+async def index_document_chunks(db: AsyncSession, document: Document, text: str) -> int:
+    """Replace the chunks of a document with the chunks of `text` and record their count. The caller commits."""
+    await db.execute(delete(DocumentChunk).where(DocumentChunk.document_id == document.id))
+    chunks = split_into_chunks(text)
+    rows = []
+    for ordinal, content in enumerate(chunks):
+        vector_indices, vector_weights = pack_vector(*vectorize(content))
+        rows.append(DocumentChunk(
+            document_id=document.id,
+            user_id=document.user_id,
+            ordinal=ordinal,
+            content=content,
+            token_count=estimate_tokens(content),
+            vector_indices=vector_indices,
+            vector_weights=vector_weights
+        ))
+    db.add_all(rows)
+    document.chunk_count = len(chunks)
+    return len(chunks)
+
+
+async def index_missing_documents(db: AsyncSession, user_id: int, load_text: Callable[[str], Optional[str]]):
+    """
+    Chunk the user's processed documents that were never chunked (uploaded before
+    retrieval existed). Each document is tried once: one without text, or whose
+    text could not be downloaded, is recorded with no chunks.
+    """
+    documents = (await db.execute(
+        select(Document)
+        .where(
+            Document.user_id == user_id,
+            Document.text_path.isnot(None),
+            Document.chunk_count.is_(None)
+        )
+    )).scalars().all()
+    if not documents:
+        return
+    texts = await asyncio.gather(*(asyncio.to_thread(load_text, document.text_path) for document in documents))
+    for document, text in zip(documents, texts):
+        if text:
+            await index_document_chunks(db, document, text)
+        else:
+            if text is None:
+                logger.error(f"Could not load the text of document {document.id}, it won't be searched")
+            document.chunk_count = 0
+    await db.commit()
+
+
+async def retrieve_passages(
+    db: AsyncSession,
+    user_id: int,
+    query: str,
+    top_k: int = RETRIEVAL_TOP_K,
+    token_budget: int = RETRIEVAL_TOKEN_BUDGET
+) -> List[DocumentChunk]:
+    """Return the user's most relevant chunks for `query`, at most `top_k` and within `token_budget`."""
+    index = await vector_indexes.get(db, user_id)
+    # Extra candidates so that oversized chunks can be skipped without running out
+    selected = []
+    used_tokens = 0
+    for chunk_id, token_count, _ in index.search(query, top_k * 3):
+        if len(selected) >= top_k:
+            break
+        if used_tokens + token_count > token_budget:
+            continue
+        selected.append(chunk_id)
+        used_tokens += token_count
+    if not selected:
+        return []
+    chunks = {chunk.id: chunk for chunk in await db.scalars(select(DocumentChunk).where(DocumentChunk.id.in_(selected)))}
+    return [chunks[chunk_id] for chunk_id in selected if chunk_id in chunks]
+
+
+def format_passages(passages: List[DocumentChunk], filenames: dict) -> str:
+    return "\n\n".join(
+        f"[{filenames.get(passage.document_id) or 'Document'}, passage {passage.ordinal + 1}]\n{passage.content}"
+        for passage in passages
+    )
@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, exists, select
+from sqlalchemy.dialects.postgresql import insert
+
+from database import AsyncSessionLocal
+from metrics import register_metrics
+from models import RevokedToken
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "database", "redis" or "memory" (single worker only)
+REVOCATION_BACKEND = os.getenv("REVOCATION_BACKEND", "database").lower()
+REVOCATION_REDIS_URL = os.getenv("REVOCATION_REDIS_URL", "redis://localhost:6379/0")
+# How often each worker reloads the Bloom filter with revocations made by other workers.
+# This bounds how long a token logged out on another worker is still accepted here.
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+# Bloom filter sizing; it is rebuilt larger if more tokens are revoked at once
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing of a sha256 digest."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.sha256(item.encode("utf-8")).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:16], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationStore(ABC):
+    """Exact record of revoked token ids, each kept until the token's own expiry."""
+
+    @abstractmethod
+    async def revoke(self, jti: str, expires_at: datetime):
+        """Record `jti` as revoked until `expires_at` (UTC)."""
+
+    @abstractmethod
+    async def is_revoked(self, jti: str) -> bool:
+        """Return whether `jti` is revoked and not yet expired."""
+
+    @abstractmethod
+    async def active_ids(self) -> List[str]:
+        """Return every revoked id that has not expired yet."""
+
+    async def purge_expired(self):
+        """Drop entries whose token has expired. Stores with native expiry do nothing."""
+
+
+class MemoryRevocationStore(RevocationStore):
+    """Revocations held by this process only. Suitable for a single worker or development."""
+
+    def __init__(self):
+        self._entries: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    async def revoke(self, jti: str, expires_at: datetime):
+        with self._lock:
+            self._entries[jti] = expires_at
+
+    async def is_revoked(self, jti: str) -> bool:
+        expires_at = self._entries.get(jti)
+        return expires_at is not None and expires_at > datetime.utcnow()
+
+    async def active_ids(self) -> List[str]:
+        now = datetime.utcnow()
+        with self._lock:
+            return [jti for jti, expires_at in self._entries.items() if expires_at > now]
+
+    async def purge_expired(self):
+        now = datetime.utcnow()
+        with self._lock:
+            for jti in [jti for jti, expires_at in self._entries.items() if expires_at <= now]:
+                del self._entries[jti]
+
+
+class DatabaseRevocationStore(RevocationStore):
+    """Revocations in the revoked_tokens table, shared by every worker using the database."""
+
+    async def revoke(self, jti: str, expires_at: datetime):
+        async with AsyncSessionLocal() as db:
+            # A single statement, so concurrent logouts with the same token cannot collide
+            await db.execute(
+                insert(RevokedToken)
+                .values(jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=[RevokedToken.jti])
+            )
+            await db.commit()
+
+    async def is_revoked(self, jti: str) -> bool:
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(select(exists().where(
+                RevokedToken.jti == jti,
+                RevokedToken.expires_at > datetime.utcnow()
+            )))
+
+    async def active_ids(self) -> List[str]:
+        async with AsyncSessionLocal() as db:
+            result = await db.scalars(select(RevokedToken.jti).where(RevokedToken.expires_at > datetime.utcnow()))
+            return list(result)
+
+    async def purge_expired(self):
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()))
+            await db.commit()
+
+
+class RedisRevocationStore(RevocationStore):
+    """
+    Revocations in Redis (or any server speaking its protocol). Each id is a key
+    expiring with the token, plus a sorted set scored by expiry used to list them.
+    The client is created on first use.
+    """
+
+    KEY_PREFIX = "revoked:"
+    INDEX_KEY = "revoked_index"
+
+    def __init__(self, url: str):
+        self.url = url
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis.asyncio as redis
+            self._client = redis.Redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    async def revoke(self, jti: str, expires_at: datetime):
+        expires = int((expires_at - datetime(1970, 1, 1)).total_seconds())
+        pipeline = self.client.pipeline()
+        pipeline.set(self.KEY_PREFIX + jti, 1, exat=expires)
+        pipeline.zadd(self.INDEX_KEY, {jti: expires})
+        await pipeline.execute()
+
+    async def is_revoked(self, jti: str) -> bool:
+        return bool(await self.client.exists(self.KEY_PREFIX + jti))
+
+    async def active_ids(self) -> List[str]:
+        return await self.client.zrangebyscore(self.INDEX_KEY, time.time(), "+inf")
+
+    async def purge_expired(self):
+        # The keys expire on their own, only the index needs trimming
+        await self.client.zremrangebyscore(self.INDEX_KEY, "-inf", time.time())
+
+
+class TokenRevocation:
+    """
+    Revocation checks with a Bloom filter in front of the exact store.
+
+    A token id missing from the filter is known not to be revoked without asking
+    the store; possible members are confirmed against it. The filter is rebuilt
+    from the store every `sync_seconds`, which also lets expired ids fall out of
+    it, so a revocation made by another worker takes effect here within that delay.
+    Revocations made by this worker take effect immediately. When a rebuild fails
+    the filter is dropped, so every check goes to the store until one succeeds.
+    """
+
+    def __init__(
+        self,
+        store: RevocationStore,
+        sync_seconds: float = REVOCATION_SYNC_SECONDS,
+        capacity: int = REVOCATION_BLOOM_CAPACITY,
+        error_rate: float = REVOCATION_BLOOM_ERROR_RATE
+    ):
+        self.store = store
+        self.sync_seconds = sync_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._bloom: Optional[BloomFilter] = None
+        self._synced_at = 0.0
+        self._lock = asyncio.Lock()
+        self.checks = 0
+        self.filtered = 0
+        self.store_checks = 0
+        self.false_positives = 0
+        self.syncs = 0
+        self.revoked_ids = 0
+
+    async def _sync(self):
+        now = time.monotonic()
+        if self._synced_at and now - self._synced_at < self.sync_seconds:
+            return
+        async with self._lock:
+            if self._synced_at and now - self._synced_at < self.sync_seconds:
+                return
+            try:
+                await self.store.purge_expired()
+                ids = await self.store.active_ids()
+            except Exception as e:
+                # A stale filter would hide revocations made since; ask the store until the next try
+                logger.error(f"Could not sync token revocations: {str(e)}")
+                self._bloom = None
+                self._synced_at = now
+                return
+            bloom = BloomFilter(max(self.capacity, 2 * len(ids)), self.error_rate)
+            for jti in ids:
+                bloom.add(jti)
+            self._bloom = bloom
+            self._synced_at = now
+            self.revoked_ids = len(ids)
+            self.syncs += 1
+
+    async def revoke(self, jti: str, expires_at: datetime):
+        await self.store.revoke(jti, expires_at)
+        if self._bloom is not None:
+            self._bloom.add(jti)
+
+    async def is_revoked(self, jti: str) -> bool:
+        self.checks += 1
+        await self._sync()
+        bloom = self._bloom
+        if bloom is not None and jti not in bloom:
+            self.filtered += 1
+            return False
+        self.store_checks += 1
+        revoked = await self.store.is_revoked(jti)
+        if not revoked and bloom is not None:
+            self.false_positives += 1
+        return revoked
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.store).__name__,
+            "checks": self.checks,
+            "filtered": self.filtered,
+            "store_checks": self.store_checks,
+            "false_positives": self.false_positives,
+            "syncs": self.syncs,
+            "revoked_ids": self.revoked_ids,
+            "bloom_bytes": len(self._bloom.bits) if self._bloom is not None else 0,
+        }
+
+
+def create_revocation_store() -> RevocationStore:
+    """Return the store selected by REVOCATION_BACKEND."""
+    if REVOCATION_BACKEND == "database":
+        return DatabaseRevocationStore()
+    if REVOCATION_BACKEND == "redis":
+        return RedisRevocationStore(REVOCATION_REDIS_URL)
+    if REVOCATION_BACKEND == "memory":
+        return MemoryRevocationStore()
+    raise ValueError(f"Unknown REVOCATION_BACKEND: {REVOCATION_BACKEND}")
+
+
+token_revocation = TokenRevocation(create_revocation_store())
+register_metrics("token_revocation", token_revocation.stats)
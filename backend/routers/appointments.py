@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta
 from typing import List, Optional, Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from models import Appointment, Patient, Doctor, User
+from models import Appointment, Patient, Doctor
 from pydantic import BaseModel
-from routers.auth import get_current_active_user
+from routers.auth import TokenClaims, get_current_claims
 import os
 import json
 from dotenv import load_dotenv
@@ -42,8 +43,8 @@ class AppointmentResponse(BaseModel):
 @router.post("/", response_model=AppointmentResponse)
 async def create_appointment(
     appointment: AppointmentCreate,
-    current_user: Annotated[User, Depends(get_current_active_user)],
-    db: Session = Depends(get_db)
+    current_user: Annotated[TokenClaims, Depends(get_current_claims)],
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new appointment. Only patients can create appointments."""
     if current_user.role != "patient":
@@ -54,7 +55,7 @@ async def create_appointment(
 
     try:
         # Verify doctor exists
-        doctor = db.query(Doctor).filter(Doctor.id == appointment.doctor_id).first()
+        doctor = await db.get(Doctor, appointment.doctor_id)
         if not doctor:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -71,11 +72,12 @@ async def create_appointment(
             status="scheduled"
         )
         db.add(db_appointment)
-        db.flush()  # Get the appointment ID
+        await db.flush()  # Get the appointment ID
 
         # Try to create Google Calendar event if credentials exist
         try:
             if os.path.exists('credentials.json') and doctor.calendar_id:
+                patient = await db.get(Patient, current_user.id)
                 from google.oauth2.credentials import Credentials
                 from google_auth_oauthlib.flow import InstalledAppFlow
                 from google.auth.transport.requests import Request
@@ -102,7 +104,7 @@ async def create_appointment(
                 service = build('calendar', 'v3', credentials=creds)
 
                 event = {
-                    'summary': f'Appointment: {current_user.first_name} {current_user.last_name} with Dr. {doctor.first_name} {doctor.last_name}',
+                    'summary': f'Appointment: {patient.first_name} {patient.last_name} with Dr. {doctor.first_name} {doctor.last_name}',
                     'description': appointment.notes or 'Medical appointment',
                     'start': {
                         'dateTime': appointment.start_time.isoformat(),
@@ -124,13 +126,13 @@ async def create_appointment(
             # Log the error but don't fail the appointment creation
             print(f"Failed to create Google Calendar event: {str(e)}")
 
-        db.commit()
-        db.refresh(db_appointment)
+        await db.commit()
+        await db.refresh(db_appointment)
 
         return db_appointment
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating appointment: {str(e)}"
@@ -138,19 +140,19 @@ async def create_appointment(
 
 @router.get("/my-appointments", response_model=List[AppointmentResponse])
 async def get_appointments(
-    current_user: Annotated[User, Depends(get_current_active_user)],
-    db: Session = Depends(get_db)
+    current_user: Annotated[TokenClaims, Depends(get_current_claims)],
+    db: AsyncSession = Depends(get_db)
 ):
     """Get all appointments for the current user."""
     try:
         if current_user.role == "patient":
-            appointments = db.query(Appointment).filter(
+            appointments = (await db.execute(select(Appointment).where(
                 Appointment.patient_id == current_user.id
-            ).all()
+            ))).scalars().all()
         elif current_user.role == "doctor":
-            appointments = db.query(Appointment).filter(
+            appointments = (await db.execute(select(Appointment).where(
                 Appointment.doctor_id == current_user.id
-            ).all()
+            ))).scalars().all()
         else:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
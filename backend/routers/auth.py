@@ -1,12 +1,18 @@
+import hashlib
+import uuid
 from datetime import datetime, timedelta, date
-from typing import Optional, Set
+from typing import Any, Dict, Optional, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, APIRouter
+from sqlalchemy import delete, event, inspect, select, update
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from models import User, Patient, Doctor
+from models import User, Patient, Doctor, RefreshToken
+from metrics import register_metrics
+from passwords import password_hasher
+from user_cache import user_cache
+from revocation import token_revocation
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel, EmailStr, ConfigDict
@@ -24,17 +30,16 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
     raise ValueError("SECRET_KEY environment variable is not set")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 120
-
-# Token blacklist to store invalidated tokens
-token_blacklist: Set[str] = set()
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Access tokens carry the user's id and role and are trusted without a database
+# lookup until they expire; refresh tokens are checked against the database
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+register_metrics("user_cache", user_cache.stats)
+
 # Base user response model without sensitive fields
 class UserResponseBase(BaseModel):
     id: int
@@ -54,9 +59,10 @@ class PatientResponse(UserResponseBase):
     gender: Optional[str] = None
     phone_number: Optional[str] = None
     address: Optional[str] = None
-    medical_history: Optional[str] = None
-    allergies: Optional[str] = None
-    current_medications: Optional[str] = None
+    # Stored as JSONB: lists, objects or plain text
+    medical_history: Optional[Any] = None
+    allergies: Optional[Any] = None
+    current_medications: Optional[Any] = None
     emergency_contact: Optional[str] = None
 
 # Doctor response model
@@ -68,7 +74,7 @@ class DoctorResponse(UserResponseBase):
     phone_number: Optional[str] = None
     address: Optional[str] = None
     consultation_fee: Optional[float] = None
-    available_hours: Optional[str] = None
+    available_hours: Optional[Dict[str, Any]] = None
 
 class CreateUserRequest(BaseModel):
     first_name: str
@@ -81,9 +87,9 @@ class CreateUserRequest(BaseModel):
     gender: Optional[str] = None
     phone_number: Optional[str] = None
     address: Optional[str] = None
-    medical_history: Optional[str] = None
-    allergies: Optional[str] = None
-    current_medications: Optional[str] = None
+    medical_history: Optional[Any] = None
+    allergies: Optional[Any] = None
+    current_medications: Optional[Any] = None
     emergency_contact: Optional[str] = None
     # Doctor fields
     specialization: Optional[str] = None
@@ -91,22 +97,40 @@ class CreateUserRequest(BaseModel):
     years_of_experience: Optional[int] = None
     hospital_affiliation: Optional[str] = None
     consultation_fee: Optional[float] = None
-    available_hours: Optional[str] = None
+    available_hours: Optional[Dict[str, Any]] = None
 
-class Token(BaseModel):
+class TokenPair(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str
+    expires_in: int  # Lifetime of the access token in seconds
+
+class Token(TokenPair):
     user: UserResponseBase
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+# Identity carried by an access token, enough to authorize most requests
+class TokenClaims(BaseModel):
+    id: int
+    email: str
+    role: str
+    token_version: int = 0
+
 class TokenBlacklist(BaseModel):
     token: str
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password off the event loop. Also returns a new hash if the stored one is outdated."""
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    """Generate password hash."""
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    """Generate password hash off the event loop."""
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token."""
@@ -115,66 +139,154 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # jti identifies the token for revocation
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    """Get current user from JWT token."""
-    credentials_exception = HTTPException(
+async def create_user_tokens(db: AsyncSession, user: User, family_id: Optional[str] = None) -> dict:
+    """
+    Issue an access token with the user's claims and a refresh token. A new login
+    starts a refresh token family, a refresh continues the family of the token it
+    replaces. The caller commits.
+    """
+    access_token = create_access_token(
+        data={"sub": user.email, "uid": user.id, "role": user.role, "ver": user.token_version, "type": "access"},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
+    now = datetime.utcnow()
+    if family_id is None:
+        family_id = uuid.uuid4().hex
+        # Clean up this user's expired refresh tokens on login
+        await db.execute(delete(RefreshToken).where(
+            RefreshToken.user_id == user.id,
+            RefreshToken.expires_at <= now
+        ))
+    refresh_id = uuid.uuid4().hex
+    expires_at = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    db.add(RefreshToken(jti=refresh_id, user_id=user.id, family_id=family_id, expires_at=expires_at))
+    refresh_token = jwt.encode(
+        {"sub": str(user.id), "fam": family_id, "ver": user.token_version, "type": "refresh", "jti": refresh_id, "exp": expires_at},
+        SECRET_KEY,
+        algorithm=ALGORITHM
+    )
+
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+
+async def revoke_refresh_family(db: AsyncSession, family_id: Optional[str]):
+    """Mark every unused refresh token of a login as used. The caller commits."""
+    if family_id:
+        await db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.family_id == family_id, RefreshToken.used_at.is_(None))
+            .values(used_at=datetime.utcnow())
+        )
+
+@event.listens_for(User, "before_update", propagate=True)
+def bump_token_version(mapper, connection, target):
+    """Deactivating a user or changing their role invalidates their refresh tokens."""
+    state = inspect(target)
+    if state.attrs.is_active.history.has_changes() or state.attrs.role.history.has_changes():
+        target.token_version = (target.token_version or 0) + 1
+
+def get_token_id(token: str, payload: dict) -> str:
+    """Return the jti of a token; tokens issued before jti was added are identified by their hash."""
+    return payload.get("jti") or hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def decode_access_token(token: str) -> dict:
+    """Validate an access token and return its payload."""
     try:
-        # Check if token is blacklisted
-        if token in token_blacklist:
-            raise credentials_exception
-            
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
+        raise credentials_exception()
+    # Tokens issued before refresh tokens existed have no type
+    if payload.get("sub") is None or payload.get("type", "access") != "access":
+        raise credentials_exception()
+
+    # Check if token was revoked by a logout
+    if await token_revocation.is_revoked(get_token_id(token, payload)):
+        raise credentials_exception()
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+    """Get current user from JWT token."""
+    payload = await decode_access_token(token)
+    user = await user_cache.get(db, payload["sub"])
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
+    if "ver" in payload and payload["ver"] != user.token_version:
+        raise credentials_exception()
     return user
 
+async def get_current_claims(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> TokenClaims:
+    """
+    Get the id and role of the current user from the access token alone. Tokens are
+    only issued to active users. Use get_current_active_user when the full profile is needed.
+    """
+    payload = await decode_access_token(token)
+    if "uid" in payload and "role" in payload:
+        return TokenClaims(id=payload["uid"], email=payload["sub"], role=payload["role"], token_version=payload.get("ver", 0))
+
+    # Tokens issued before claims were added
+    user = await user_cache.get(db, payload["sub"])
+    if user is None:
+        raise credentials_exception()
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return TokenClaims(id=user.id, email=user.email, role=user.role, token_version=user.token_version)
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     """Get current active user."""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-    """Authenticate user with email and password."""
-    user = db.query(User).filter(User.email == email).first()
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
+    """Authenticate user with email and password, upgrading the stored hash to the current cost."""
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if not user:
         return None
-    if not verify_password(password, user.password):
+    valid, new_hash = await verify_password(password, user.password)
+    if not valid:
         return None
+    if new_hash is not None:
+        user.password = new_hash
+        await db.commit()
     return user
 
 @router.post("/register", response_model=UserResponseBase, status_code=status.HTTP_201_CREATED)
-async def create_user(user: CreateUserRequest, db: Session = Depends(get_db)):
+async def create_user(user: CreateUserRequest, db: AsyncSession = Depends(get_db)):
     # Check if user already exists
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = (await db.execute(select(User).where(User.email == user.email))).scalars().first()
     if db_user:
         raise HTTPException(
             status_code=400,
             detail="Email already registered"
         )
     
+    # Hashed before the try block so an overloaded hasher surfaces as 503, not 500
+    hashed_password = await get_password_hash(user.password)
+
     try:
         # Create base user attributes
         user_attrs = {
             "first_name": user.first_name,
             "last_name": user.last_name,
             "email": user.email,
-            "password": get_password_hash(user.password),
+            "password": hashed_password,
             "role": user.role.lower(),
             "is_active": True,
             "created_at": datetime.utcnow(),
@@ -213,12 +325,12 @@ async def create_user(user: CreateUserRequest, db: Session = Depends(get_db)):
             )
         
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
         return new_user
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Error creating user: {str(e)}"
@@ -227,29 +339,68 @@ async def create_user(user: CreateUserRequest, db: Session = Depends(get_db)):
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    tokens = await create_user_tokens(db, user)
+    await db.commit()
     
     # Return user data without sensitive fields
     user_response = UserResponseBase.model_validate(user)
     
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **tokens,
         "user": user_response
     }
 
+@router.post("/refresh", response_model=TokenPair)
+async def refresh_access_token(request: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access token and refresh token. Each refresh
+    token works once; presenting a used one again revokes the whole login.
+    """
+    try:
+        payload = jwt.decode(request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_exception()
+    if payload.get("type") != "refresh" or not payload.get("jti"):
+        raise credentials_exception()
+
+    now = datetime.utcnow()
+    # Conditional update so concurrent refreshes with the same token cannot both succeed
+    rotated = await db.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.jti == payload["jti"],
+            RefreshToken.used_at.is_(None),
+            RefreshToken.expires_at > now
+        )
+        .values(used_at=now)
+    )
+    if not rotated.rowcount:
+        await revoke_refresh_family(db, payload.get("fam"))
+        await db.commit()
+        raise credentials_exception()
+
+    # The only database check: the user must still be active with the same role
+    user = await db.get(User, int(payload["sub"]))
+    if user is None or not user.is_active or user.token_version != payload.get("ver"):
+        await revoke_refresh_family(db, payload.get("fam"))
+        await db.commit()
+        raise credentials_exception()
+
+    tokens = await create_user_tokens(db, user, payload["fam"])
+    await db.commit()
+    return tokens
+
 @router.get("/me", response_model=UserResponseBase)
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
     return current_user
@@ -258,7 +409,7 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
 async def delete_user(
     user_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete a user. Only the user themselves can delete their account."""
     if current_user.id != user_id:
@@ -268,10 +419,10 @@ async def delete_user(
         )
     
     try:
-        db.delete(current_user)
-        db.commit()
+        await db.delete(current_user)
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error deleting user: {str(e)}"
@@ -279,11 +430,14 @@ async def delete_user(
 
 @router.post("/logout")
 async def logout(
-    current_user: User = Depends(get_current_active_user),
-    token: str = Depends(oauth2_scheme)
+    request: Optional[LogoutRequest] = None,
+    current_user: TokenClaims = Depends(get_current_claims),
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    Logout the current user by blacklisting their token.
+    Logout the current user by revoking their token until it expires, and
+    the refresh token of this login when it is sent along.
     Only works if user is currently logged in.
     """
     if not current_user:
@@ -293,8 +447,17 @@ async def logout(
         )
     
     try:
-        # Add token to blacklist
-        token_blacklist.add(token)
+        # The token was validated by get_current_claims, so it decodes and carries exp
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        await token_revocation.revoke(get_token_id(token, payload), datetime.utcfromtimestamp(payload["exp"]))
+        if request is not None and request.refresh_token:
+            try:
+                refresh_payload = jwt.decode(request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+            except JWTError:
+                refresh_payload = {}
+            if refresh_payload.get("type") == "refresh" and refresh_payload.get("sub") == str(current_user.id):
+                await revoke_refresh_family(db, refresh_payload.get("fam"))
+                await db.commit()
         return {"message": "Successfully logged out"}
     except Exception as e:
         raise HTTPException(
@@ -1,19 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, true, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+import asyncio
 import json
 import logging
+import time
 from pydantic import BaseModel, validator, ConfigDict
-import aiohttp
-import asyncio
 
-from database import get_db
-from models import Conversation, Message, User, Patient
-from routers.auth import get_current_user, get_current_active_user
-from asi_mini import call_asi_one_chatbot
-from prompts import INITIAL_MESSAGE, DOCUMENT_DIAGNOSIS, PROMPT_TO_ANSWER_FROM_PDF
-from routers.upload_docs import get_user_files
+from database import get_db, AsyncSessionLocal
+from models import Conversation, Message, Document
+from routers.auth import TokenClaims, get_current_claims
+from asi_mini import acall_asi_one_chatbot, astream_asi_one_chatbot
+from prompts import INITIAL_MESSAGE, DOCUMENT_DIAGNOSIS
+from document_summaries import get_document_summaries
+from conversation_context import build_history
+from retrieval import index_missing_documents, retrieve_passages, format_passages
+from routers.upload_docs import uploader
+from pagination import PageSize, encode_cursor, decode_cursor
+from message_notifier import message_notifier, LONG_POLL_MAX_SECONDS, LONG_POLL_INTERVAL_SECONDS
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -23,6 +31,9 @@ router = APIRouter(
     tags=["conversations"]
 )
 
+# Characters of the last message returned in conversation summaries
+SUMMARY_PREVIEW_CHARS = 120
+
 # Pydantic models for request/response
 class MessageBase(BaseModel):
     content: str
@@ -43,19 +54,6 @@ class MessageResponse(MessageBase):
 
     model_config = ConfigDict(from_attributes=True)
 
-    @validator('message_metadata', pre=True)
-    def parse_metadata(cls, v):
-        if v is None:
-            return None
-        if isinstance(v, str):
-            try:
-                return json.loads(v)
-            except json.JSONDecodeError:
-                return None
-        if hasattr(v, '__dict__'):
-            return dict(v.__dict__)
-        return v
-
 class ConversationBase(BaseModel):
     context: Optional[Dict[str, Any]] = None
 
@@ -64,7 +62,8 @@ class ConversationBase(BaseModel):
 class ConversationCreate(ConversationBase):
     pass
 
-class ConversationResponse(ConversationBase):
+class ConversationInfo(ConversationBase):
+    """Conversation without its messages."""
     id: int
     user_id: int
     start_time: datetime
@@ -72,22 +71,11 @@ class ConversationResponse(ConversationBase):
     status: str
     created_at: datetime
     updated_at: datetime
-    messages: List[MessageResponse] = []
 
     model_config = ConfigDict(from_attributes=True)
 
-    @validator('context', pre=True)
-    def parse_context(cls, v):
-        if v is None:
-            return None
-        if isinstance(v, str):
-            try:
-                return json.loads(v)
-            except json.JSONDecodeError:
-                return None
-        if hasattr(v, '__dict__'):
-            return dict(v.__dict__)
-        return v
+class ConversationResponse(ConversationInfo):
+    messages: List[MessageResponse] = []
 
     @validator('messages', pre=True)
     def parse_messages(cls, v):
@@ -97,38 +85,142 @@ class ConversationResponse(ConversationBase):
             return [MessageResponse.from_orm(msg) for msg in v]
         return []
 
-# Get all conversations for the current user
-@router.get("/my-conversations", response_model=List[ConversationResponse])
-def get_user_conversations(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+class ConversationPage(BaseModel):
+    """Conversations, most recently updated first. Pass `next_cursor` back to get the next page."""
+    items: List[ConversationInfo]
+    next_cursor: Optional[str] = None
+
+class ConversationSummary(BaseModel):
+    """What a conversation list shows: no context and no message bodies."""
+    id: int
+    status: str
+    start_time: datetime
+    end_time: Optional[datetime]
+    created_at: datetime
+    updated_at: datetime
+    message_count: int
+    last_message_preview: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ConversationSummaryPage(BaseModel):
+    """Conversation summaries, most recently updated first. Pass `next_cursor` back to get the next page."""
+    items: List[ConversationSummary]
+    next_cursor: Optional[str] = None
+
+class MessagePage(BaseModel):
+    """Messages in chronological order. Pass `next_cursor` back to get the older ones."""
+    items: List[MessageResponse]
+    next_cursor: Optional[str] = None
+
+class MessageSync(BaseModel):
+    """Messages saved after a cursor, oldest first. `cursor` is the id to pass on the next call."""
+    items: List[MessageResponse]
+    cursor: int
+    has_more: bool = False
+
+async def get_readable_conversation(db: AsyncSession, conversation_id: int, current_user: TokenClaims) -> Conversation:
+    """Load a conversation (without messages) and verify the current user may read it."""
+    conversation = await db.get(Conversation, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    # Verify user has access to this conversation
+    if conversation.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this conversation")
+    return conversation
+
+# Get the conversations of the current user, one page at a time
+@router.get("/my-conversations", response_model=ConversationPage)
+async def get_user_conversations(
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
+):
+    query = select(Conversation).where(Conversation.user_id == current_user.id)
+    after = decode_cursor(cursor)
+    if after:
+        query = query.where(tuple_(Conversation.updated_at, Conversation.id) < tuple_(*after))
+    # One extra row tells whether there is a next page
+    conversations = (await db.execute(
+        query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1)
+    )).scalars().all()
+
+    next_cursor = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        last = conversations[-1]
+        next_cursor = encode_cursor(last.updated_at, last.id)
+    return ConversationPage(items=conversations, next_cursor=next_cursor)
+
+# Summaries of the current user's conversations for list views, one page at a time
+@router.get("/my-conversations/summaries", response_model=ConversationSummaryPage)
+async def get_user_conversation_summaries(
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
 ):
-    conversations = (
-        db.query(Conversation)
-        .options(joinedload(Conversation.messages))
-        .filter(Conversation.user_id == current_user.id)
-        .all()
+    # Both read ix_messages_conversation_id_timestamp: the latest message through a
+    # lateral join, the count through a correlated subquery. Only the preview of the
+    # last message body leaves the database.
+    last_message = (
+        select(
+            func.left(Message.content, SUMMARY_PREVIEW_CHARS).label("preview"),
+            Message.timestamp
+        )
+        .where(Message.conversation_id == Conversation.id)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(1)
+        .lateral("last_message")
+    )
+    message_count = (
+        select(func.count())
+        .where(Message.conversation_id == Conversation.id)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            Conversation.id,
+            Conversation.status,
+            Conversation.start_time,
+            Conversation.end_time,
+            Conversation.created_at,
+            Conversation.updated_at,
+            message_count.label("message_count"),
+            last_message.c.preview.label("last_message_preview"),
+            last_message.c.timestamp.label("last_message_at")
+        )
+        .outerjoin(last_message, true())
+        .where(Conversation.user_id == current_user.id)
+    )
+    after = decode_cursor(cursor)
+    if after:
+        query = query.where(tuple_(Conversation.updated_at, Conversation.id) < tuple_(*after))
+    rows = (await db.execute(
+        query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1)
+    )).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id)
+    return ConversationSummaryPage(
+        items=[ConversationSummary.model_validate(row) for row in rows],
+        next_cursor=next_cursor
     )
-    
-    # Sort messages by timestamp for each conversation
-    for conv in conversations:
-        conv.messages.sort(key=lambda x: x.timestamp)
-    
-    # Log the conversations for debugging
-    for conv in conversations:
-        logger.debug(f"Retrieved conversation: {conv.__dict__}")
-    
-    return conversations
 
 # Create a new conversation
 @router.post("/", response_model=ConversationResponse, status_code=status.HTTP_201_CREATED)
-def create_conversation(
+async def create_conversation(
     conversation: ConversationCreate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
 ):
     # Verify user is a patient
-    if not isinstance(current_user, Patient):
+    if current_user.role != "patient":
         raise HTTPException(
             status_code=403,
             detail="Only patients can create conversations"
@@ -137,50 +229,115 @@ def create_conversation(
     # Create new conversation
     db_conversation = Conversation(
         user_id=current_user.id,
-        context=json.dumps(conversation.context) if conversation.context else None
+        context=conversation.context or None,
+        # Set so the response doesn't lazy load the (empty) collection
+        messages=[]
     )
     
     db.add(db_conversation)
-    db.commit()
-    db.refresh(db_conversation)
+    # Sessions don't expire objects on commit, defaults set on insert are already loaded
+    await db.commit()
     
     logger.debug(f"Created conversation: {db_conversation.__dict__}")
     
     return db_conversation
 
-# Get conversation history
-@router.get("/{conversation_id}", response_model=ConversationResponse)
-def get_conversation(
+# Get a conversation; its messages are listed by /{conversation_id}/messages
+@router.get("/{conversation_id}", response_model=ConversationInfo)
+async def get_conversation(
     conversation_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
 ):
-    conversation = (
-        db.query(Conversation)
-        .options(joinedload(Conversation.messages))
-        .filter(Conversation.id == conversation_id)
-        .first()
-    )
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    # Verify user has access to this conversation
-    if conversation.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to access this conversation")
+    conversation = await get_readable_conversation(db, conversation_id, current_user)
     
     # Log the conversation object for debugging
     logger.debug(f"Retrieved conversation: {conversation.__dict__}")
     
     return conversation
 
+# Get conversation history, newest page first
+@router.get("/{conversation_id}/messages", response_model=MessagePage)
+async def get_conversation_messages(
+    conversation_id: int,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
+):
+    await get_readable_conversation(db, conversation_id, current_user)
+
+    query = select(Message).where(Message.conversation_id == conversation_id)
+    before = decode_cursor(cursor)
+    if before:
+        query = query.where(tuple_(Message.timestamp, Message.id) < tuple_(*before))
+    # Walks ix_messages_conversation_id_timestamp backwards; one extra row tells whether there are older messages
+    messages = (await db.execute(
+        query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1)
+    )).scalars().all()
+
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        oldest = messages[-1]
+        next_cursor = encode_cursor(oldest.timestamp, oldest.id)
+    return MessagePage(items=list(reversed(messages)), next_cursor=next_cursor)
+
+# Get the messages saved after a known one, optionally waiting for the next one
+@router.get("/{conversation_id}/messages/since", response_model=MessageSync)
+async def get_new_messages(
+    conversation_id: int,
+    after_id: int = Query(0, ge=0, description="Id of the last message the client has"),
+    wait: float = Query(0, ge=0, le=LONG_POLL_MAX_SECONDS, description="Seconds to wait when there is nothing new"),
+    limit: int = PageSize,
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Returns only the messages after `after_id`. With `wait`, an empty result is held
+    back until a message arrives (e.g. the assistant's reply) or the wait runs out.
+    Messages are saved through insert_message, which commits them in id order.
+    """
+    await get_readable_conversation(db, conversation_id, current_user)
+
+    deadline = time.monotonic() + wait
+    while True:
+        event = message_notifier.listen(conversation_id)
+        try:
+            messages = (await db.execute(
+                select(Message)
+                .where(Message.conversation_id == conversation_id, Message.id > after_id)
+                .order_by(Message.id)
+                .limit(limit + 1)
+            )).scalars().all()
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                break
+            # Give the connection back to the pool while waiting
+            await db.rollback()
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, LONG_POLL_INTERVAL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            message_notifier.unlisten(conversation_id, event)
+
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    return MessageSync(
+        items=messages,
+        cursor=messages[-1].id if messages else after_id,
+        has_more=has_more
+    )
+
 # Delete a conversation
 @router.delete("/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_conversation(
+async def delete_conversation(
     conversation_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
 ):
-    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    conversation = await db.get(Conversation, conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
@@ -188,124 +345,175 @@ def delete_conversation(
     if conversation.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this conversation")
     
-    db.delete(conversation)
-    db.commit()
+    await db.delete(conversation)
+    await db.commit()
     return None
 
-# Add a message to a conversation
-@router.post("/{conversation_id}/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
-async def add_message(
-    conversation_id: int,
-    message: MessageCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    # Verify conversation exists
-    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+async def get_writable_conversation(db: AsyncSession, conversation_id: int, current_user: TokenClaims) -> Conversation:
+    """Load a conversation and verify the current user may send messages in it."""
+    conversation = await db.get(Conversation, conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     # Verify user has access to this conversation
     if conversation.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to send messages in this conversation")
+    return conversation
 
-    # Save patient's question
+async def insert_message(db: AsyncSession, message: Message) -> Message:
+    """
+    Save a message holding a lock on its conversation from id assignment to commit,
+    so the messages of a conversation become visible in id order and the
+    "messages since" cursor can't move past one that commits later.
+    """
+    await db.execute(
+        select(Conversation.id).where(Conversation.id == message.conversation_id).with_for_update()
+    )
+    db.add(message)
+    await db.commit()
+    await db.refresh(message)
+    message_notifier.notify(message.conversation_id)
+    return message
+
+async def save_question(db: AsyncSession, conversation_id: int, current_user: TokenClaims, message: MessageCreate) -> Message:
+    """Save the patient's question."""
     question = Message(
         conversation_id=conversation_id,
         patient_id=current_user.id,
         content=message.content,
         message_type=message.message_type,
-        message_metadata=json.dumps(message.message_metadata) if message.message_metadata else None
+        message_metadata=message.message_metadata or None
     )
-    db.add(question)
-    db.commit()
-    db.refresh(question)
+    await insert_message(db, question)
 
     logger.debug(f"Patient question saved: {question.__dict__}")
+    return question
+
+async def build_prompt(db: AsyncSession, conversation: Conversation, user_id: int, question: str) -> List[Dict[str, str]]:
+    """Build the message list sent to the model for the next assistant turn."""
+    formatted_history = []
+    formatted_history.append(INITIAL_MESSAGE)
+    
+    # Create a copy of DOCUMENT_DIAGNOSIS to avoid modifying the original
+    document_diagnosis = DOCUMENT_DIAGNOSIS.copy()
+
+    # Only the document passages relevant to the question go into the prompt
+    await index_missing_documents(db, user_id, uploader.download_text)
+    passages = await retrieve_passages(db, user_id, question)
+    if passages:
+        filenames = dict((await db.execute(
+            select(Document.id, Document.filename)
+            .where(Document.id.in_({passage.document_id for passage in passages}))
+        )).all())
+        document_context = format_passages(passages, filenames)
+    else:
+        # Nothing matched the question, fall back to the summaries computed at upload
+        summaries = await get_document_summaries(db, user_id, uploader.download_text)
+        document_context = "\n\n".join(summaries)
+    if document_context:
+        document_diagnosis['content'] += document_context
+        logger.debug(f"Document diagnosis: {document_diagnosis}")
+        formatted_history.append(document_diagnosis)
+
+    # Add the rolling summary and the most recent messages
+    formatted_history.extend(await build_history(db, conversation))
+
+    logger.debug(f"Formatted history: {formatted_history}")
+    return formatted_history
+
+async def save_answer(db: AsyncSession, conversation_id: int, question_id: int, content: str) -> Message:
+    """Save the assistant's response to a question."""
+    answer = Message(
+        conversation_id=conversation_id,
+        parent_message_id=question_id,
+        content=content,
+        message_type="text"
+    )
+    await insert_message(db, answer)
+
+    logger.debug(f"Assistant response saved: {answer.__dict__}")
+    return answer
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Add a message to a conversation
+@router.post("/{conversation_id}/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
+async def add_message(
+    conversation_id: int,
+    message: MessageCreate,
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
+):
+    conversation = await get_writable_conversation(db, conversation_id, current_user)
+    question = await save_question(db, conversation_id, current_user, message)
 
     try:
-        # Fetch conversation history for context
-        messages = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.timestamp.asc()).all()
-        formatted_history = []
-        formatted_history.append(INITIAL_MESSAGE)
-        
-        # Create a copy of DOCUMENT_DIAGNOSIS to avoid modifying the original
-        document_diagnosis = DOCUMENT_DIAGNOSIS.copy()
-
-        # Get user's uploaded files and their content
-        uploaded_files = await get_user_files(current_user, db)
-        if uploaded_files:
-
-            # Fetch content from all text files concurrently
-            async with aiohttp.ClientSession() as session:
-                tasks = []
-                for file in uploaded_files:
-                    if file.text_file and file.text_file['url']:
-                        tasks.append(fetch_file_content(session, file.text_file['url']))
-                
-                if tasks:
-                    contents = await asyncio.gather(*tasks)
-                    for content in contents:
-                        if content:
-                            r = call_asi_one_chatbot([
-                                PROMPT_TO_ANSWER_FROM_PDF,
-                                {"role": "user", "content": content}
-                            ], 1000)
-                            document_diagnosis['content'] += r
-                            logger.debug(f"Document diagnosis: {document_diagnosis}")
-
-            formatted_history.append(document_diagnosis)
-
-        # Add conversation history
-        for msg in messages:
-            formatted_history.append({"role": "user" if msg.patient_id else "assistant", "content": msg.content})
-
-        
-        logger.debug(f"Formatted history: {formatted_history}")
+        formatted_history = await build_prompt(db, conversation, current_user.id, message.content)
 
         # Get assistant's response
-        response = call_asi_one_chatbot(formatted_history, 500)
-        assistant_reply = response
-
-        # Save assistant's response
-        answer = Message(
-            conversation_id=conversation_id,
-            parent_message_id=question.id,
-            content=assistant_reply,
-            message_type="text"
-        )
-        db.add(answer)
-        db.commit()
-        db.refresh(answer)
+        assistant_reply = await acall_asi_one_chatbot(formatted_history, 500)
 
-        logger.debug(f"Assistant response saved: {answer.__dict__}")
-        return answer
+        return await save_answer(db, conversation_id, question.id, assistant_reply)
 
     except Exception as e:
         logger.error(f"Assistant error: {e}")
         raise HTTPException(status_code=500, detail="Assistant failed to respond")
 
-async def fetch_file_content(session: aiohttp.ClientSession, url: str) -> str:
-    """Fetch content from a text file URL."""
+# Add a message and stream the assistant's response as server-sent events
+@router.post("/{conversation_id}/messages/stream")
+async def stream_message(
+    conversation_id: int,
+    message: MessageCreate,
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Same as adding a message, but the answer is streamed while it is generated.
+    Emits `token` events with partial content, then a single `done` event with the
+    saved message, or an `error` event if the assistant failed to respond.
+    """
+    conversation = await get_writable_conversation(db, conversation_id, current_user)
+    question = await save_question(db, conversation_id, current_user, message)
+    question_id = question.id
+
     try:
-        async with session.get(url) as response:
-            if response.status == 200:
-                return await response.text()
-            else:
-                logger.error(f"Failed to fetch content from {url}: {response.status}")
-                return None
+        formatted_history = await build_prompt(db, conversation, current_user.id, message.content)
     except Exception as e:
-        logger.error(f"Error fetching content from {url}: {str(e)}")
-        return None
+        logger.error(f"Assistant error: {e}")
+        raise HTTPException(status_code=500, detail="Assistant failed to respond")
+
+    async def event_stream():
+        parts = []
+        try:
+            async for token in astream_asi_one_chatbot(formatted_history, 500):
+                parts.append(token)
+                yield format_sse("token", {"content": token})
+        except Exception as e:
+            logger.error(f"Assistant streaming error: {e}")
+            yield format_sse("error", {"detail": "Assistant failed to respond"})
+            return
+
+        # The request's session is not guaranteed to outlive the response, use a dedicated one
+        async with AsyncSessionLocal() as stream_db:
+            answer = await save_answer(stream_db, conversation_id, question_id, "".join(parts))
+            yield format_sse("done", MessageResponse.model_validate(answer).model_dump(mode="json"))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Delete a message
 @router.delete("/messages/{message_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_message(
+async def delete_message(
     message_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
 ):
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = await db.get(Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
@@ -313,24 +521,23 @@ def delete_message(
     if message.sender_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this message")
     
-    db.delete(message)
-    db.commit()
+    await db.delete(message)
+    await db.commit()
     return None
 
 # Update conversation status
 @router.patch("/{conversation_id}/status", response_model=ConversationResponse)
-def update_conversation_status(
+async def update_conversation_status(
     conversation_id: int,
     status: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: TokenClaims = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
 ):
-    conversation = (
-        db.query(Conversation)
-        .options(joinedload(Conversation.messages))
-        .filter(Conversation.id == conversation_id)
-        .first()
-    )
+    conversation = (await db.execute(
+        select(Conversation)
+        .options(selectinload(Conversation.messages))
+        .where(Conversation.id == conversation_id)
+    )).scalars().first()
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
@@ -342,8 +549,7 @@ def update_conversation_status(
     if status == "completed":
         conversation.end_time = datetime.utcnow()
     
-    db.commit()
-    db.refresh(conversation)
+    await db.commit()
     
     # Log the conversation object for debugging
     logger.debug(f"Updated conversation: {conversation.__dict__}")
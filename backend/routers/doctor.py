@@ -1,21 +1,22 @@
 from datetime import datetime
-from typing import List, Optional, Annotated
+from typing import Any, Dict, List, Optional, Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from models import Doctor, User, Patient
+from models import Doctor, Patient
 from pydantic import BaseModel
-from routers.auth import get_current_active_user
-from passlib.context import CryptContext
-import json
+from routers.auth import TokenClaims, get_current_claims
+from passwords import password_hasher
 
 router = APIRouter(
     prefix="/doctors",
     tags=["doctors"]
 )
 
-user_dependency = Annotated[User, Depends(get_current_active_user)]
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+user_dependency = Annotated[TokenClaims, Depends(get_current_claims)]
 
 # Pydantic models for request/response
 class DoctorBase(BaseModel):
@@ -26,7 +27,7 @@ class DoctorBase(BaseModel):
     phone_number: str
     address: str
     consultation_fee: float
-    available_hours: str  # JSON string
+    available_hours: Dict[str, Any]  # Weekday -> {"start": "09:00", "end": "17:00"}
     calendar_id: str
 
 class DoctorCreate(DoctorBase):
@@ -40,7 +41,7 @@ class DoctorUpdate(DoctorBase):
     phone_number: Optional[str] = None
     address: Optional[str] = None
     consultation_fee: Optional[float] = None
-    available_hours: Optional[str] = None
+    available_hours: Optional[Dict[str, Any]] = None
     calendar_id: Optional[str] = None
 
 class DoctorResponse(DoctorBase):
@@ -56,12 +57,12 @@ class DoctorResponse(DoctorBase):
 
 @router.post("/mock-doctor")
 async def create_mock_doctor(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a mock doctor for testing purposes."""
     try:
         # Check if mock doctor already exists
-        existing_doctor = db.query(Doctor).filter(Doctor.email == "doctor@example.com").first()
+        existing_doctor = (await db.execute(select(Doctor).where(Doctor.email == "doctor@example.com"))).scalars().first()
         if existing_doctor:
             return {"message": "Mock doctor already exists", "doctor_id": existing_doctor.id}
 
@@ -70,7 +71,7 @@ async def create_mock_doctor(
             first_name="John",
             last_name="Doe",
             email="doctor@example.com",
-            password=pwd_context.hash("doctor123"),
+            password=await password_hasher.hash("doctor123"),
             role="doctor",
             specialization="General Medicine",
             license_number="MD123456",
@@ -79,19 +80,19 @@ async def create_mock_doctor(
             phone_number="+1234567890",
             address="123 Medical Center Dr",
             consultation_fee=100.00,
-            available_hours=json.dumps({
+            available_hours={
                 "monday": {"start": "09:00", "end": "17:00"},
                 "tuesday": {"start": "09:00", "end": "17:00"},
                 "wednesday": {"start": "09:00", "end": "17:00"},
                 "thursday": {"start": "09:00", "end": "17:00"},
                 "friday": {"start": "09:00", "end": "17:00"}
-            }),
+            },
             calendar_id="primary"  # Using primary calendar for testing
         )
 
         db.add(mock_doctor)
-        db.commit()
-        db.refresh(mock_doctor)
+        await db.commit()
+        await db.refresh(mock_doctor)
 
         return {
             "message": "Mock doctor created successfully",
@@ -101,7 +102,7 @@ async def create_mock_doctor(
         }
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating mock doctor: {str(e)}"
@@ -112,7 +113,7 @@ async def update_doctor(
     doctor_id: int,
     doctor_update: DoctorUpdate,
     user: user_dependency,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update a doctor's profile. Only the doctor themselves can update their profile."""
     if user.id != doctor_id or user.role != "doctor":
@@ -122,7 +123,7 @@ async def update_doctor(
         )
     
     try:
-        doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+        doctor = (await db.execute(select(Doctor).where(Doctor.id == doctor_id))).scalars().first()
         if not doctor:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -135,12 +136,12 @@ async def update_doctor(
             setattr(doctor, field, value)
         
         doctor.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(doctor)
+        await db.commit()
+        await db.refresh(doctor)
         return doctor
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error updating doctor: {str(e)}"
@@ -150,11 +151,11 @@ async def update_doctor(
 async def get_doctor(
     doctor_id: int,
     user: user_dependency,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get a doctor's profile. Any authenticated user can view doctor profiles."""
     try:
-        doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+        doctor = (await db.execute(select(Doctor).where(Doctor.id == doctor_id))).scalars().first()
         if not doctor:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -172,11 +173,25 @@ async def get_doctor(
 @router.get("/", response_model=List[DoctorResponse])
 async def list_doctors(
     user: user_dependency,
-    db: Session = Depends(get_db)
+    weekday: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    """List all doctors. Any authenticated user can view the list of doctors."""
+    """
+    List all doctors. Any authenticated user can view the list of doctors.
+    With `weekday`, only doctors having hours on that day are listed.
+    """
+    query = select(Doctor)
+    if weekday is not None:
+        weekday = weekday.lower()
+        if weekday not in WEEKDAYS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"weekday must be one of: {', '.join(WEEKDAYS)}"
+            )
+        # available_hours ? 'monday', served by the GIN index on available_hours
+        query = query.where(Doctor.available_hours.has_key(weekday))
     try:
-        doctors = db.query(Doctor).all()
+        doctors = (await db.execute(query)).scalars().all()
         return doctors
     except Exception as e:
         raise HTTPException(
@@ -1,11 +1,12 @@
 from datetime import datetime, date
-from typing import List, Optional, Annotated
+from typing import Any, List, Optional, Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from models import Patient, User
+from models import Patient
 from pydantic import BaseModel
-from routers.auth import get_current_active_user
+from routers.auth import TokenClaims, get_current_claims
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -16,7 +17,7 @@ router = APIRouter(
     tags=["patients"]
 )
 
-user_dependency = Annotated[User, Depends(get_current_active_user)]
+user_dependency = Annotated[TokenClaims, Depends(get_current_claims)]
 
 # Pydantic models for request/response
 class PatientBase(BaseModel):
@@ -24,9 +25,10 @@ class PatientBase(BaseModel):
     gender: str
     phone_number: str
     address: str
-    medical_history: Optional[str] = None
-    allergies: Optional[str] = None
-    current_medications: Optional[str] = None
+    # Stored as JSONB: lists, objects or plain text
+    medical_history: Optional[Any] = None
+    allergies: Optional[Any] = None
+    current_medications: Optional[Any] = None
     emergency_contact: str
 
 class PatientCreate(PatientBase):
@@ -37,9 +39,9 @@ class PatientUpdate(PatientBase):
     gender: Optional[str] = None
     phone_number: Optional[str] = None
     address: Optional[str] = None
-    medical_history: Optional[str] = None
-    allergies: Optional[str] = None
-    current_medications: Optional[str] = None
+    medical_history: Optional[Any] = None
+    allergies: Optional[Any] = None
+    current_medications: Optional[Any] = None
     emergency_contact: Optional[str] = None
 
 class PatientResponse(PatientBase):
@@ -58,7 +60,7 @@ async def update_patient(
     patient_id: int,
     patient_update: PatientUpdate,
     user: user_dependency,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update a patient's profile. Only the patient themselves can update their profile."""
     if user.id != patient_id or user.role != "patient":
@@ -68,7 +70,7 @@ async def update_patient(
         )
     
     try:
-        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        patient = (await db.execute(select(Patient).where(Patient.id == patient_id))).scalars().first()
         if not patient:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -81,12 +83,12 @@ async def update_patient(
             setattr(patient, field, value)
         
         patient.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(patient)
+        await db.commit()
+        await db.refresh(patient)
         return patient
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error updating patient: {str(e)}"
@@ -96,11 +98,11 @@ async def update_patient(
 async def get_patient(
     patient_id: int,
     user: user_dependency,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get a patient's profile. Only the patient themselves or their doctors can view the profile."""
     try:
-        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        patient = (await db.execute(select(Patient).where(Patient.id == patient_id))).scalars().first()
         if not patient:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
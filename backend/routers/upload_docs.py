@@ -1,16 +1,22 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, APIRouter, Depends
-from supabase import create_client, Client
+from fastapi import FastAPI, File, UploadFile, HTTPException, APIRouter, Depends, Response, status
+from fastapi.responses import StreamingResponse
 import os
-from dotenv import load_dotenv
-from sqlalchemy.orm import Session
+import mimetypes
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from models import User
-from routers.auth import get_current_active_user
-from typing import Annotated, List
+from models import Document
+from ingestion import IngestionJob, IngestionQueue
+from signed_urls import SignedUrlCache
+from metrics import register_metrics
+from storage import StorageBackend, LocalStorage, get_storage
+from routers.auth import TokenClaims, get_current_claims
+from typing import Annotated, BinaryIO, Iterator, List, Optional
 from pydantic import BaseModel
-import fitz
-import tempfile
+from datetime import datetime, timezone
+from starlette.concurrency import run_in_threadpool
 import uuid
+import hashlib
 import logging
 
 # Set up logging
@@ -22,193 +28,272 @@ router = APIRouter(
     tags=["upload"]
 )
 
-load_dotenv()  
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+ALLOWED_CONTENT_TYPES = {"application/pdf"}
+PDF_MAGIC = b"%PDF-"
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-BUCKET_NAME = "documents"
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+class UploadTooLarge(Exception):
+    pass
 
 class FileInfo(BaseModel):
+    id: int
     document_id: str
-    original_file: dict
-    text_file: dict
+    status: str
+    original_file: Optional[dict]
+    text_file: Optional[dict]
     created_at: str
     last_accessed_at: str
+    # When the first of the signed URLs above expires; clients reuse the listing until then
+    urls_expire_at: Optional[str] = None
+
+class DocumentStatus(BaseModel):
+    id: int
+    status: str
+    error: Optional[str] = None
+    summary_ready: bool
+    created_at: datetime
+    updated_at: datetime
 
 class DocumentUploader:
-    def __init__(self, supabase_client: Client, bucket_name: str):
-        self.supabase = supabase_client
-        self.bucket = bucket_name
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+
+    def download(self, path: str) -> bytes:
+        """Download a file from storage."""
+        return self.storage.get(path)
+
+    def download_text(self, text_path: str) -> Optional[str]:
+        """Download an extracted text file from storage."""
+        try:
+            return self.download(text_path).decode('utf-8')
+        except Exception as e:
+            logger.error(f"Failed to download {text_path}: {str(e)}")
+            return None
 
-    def extract_text_from_pdf(self, file_content: bytes) -> str:
-        # Create a temporary file to store the PDF content
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_pdf:
-            temp_pdf.write(file_content)
-            temp_pdf_path = temp_pdf.name
+    def _read_upload(self, source: BinaryIO, first_chunk: bytes, digest) -> Iterator[bytes]:
+        """Yield the upload in chunks, hashing and enforcing the size limit on the fly."""
+        size = 0
+        chunk = first_chunk
+        while chunk:
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise UploadTooLarge()
+            digest.update(chunk)
+            yield chunk
+            chunk = source.read(UPLOAD_CHUNK_SIZE)
 
+    def store_original(self, source: BinaryIO, first_chunk: bytes, filename: str, content_type: str, user_id: int) -> dict:
+        """Stream the original file into a new document folder."""
+        # Create a unique folder for this document
+        document_id = str(uuid.uuid4())
+        user_folder = f"user_{user_id}"
+        document_folder = f"{user_folder}/{document_id}"
+        
+        # Get original filename without extension
+        original_name = os.path.splitext(filename)[0]
+        
+        # Upload original file
+        original_filename = f"{document_folder}/{original_name}{os.path.splitext(filename)[1]}"
+        digest = hashlib.sha256()
+        chunks = self._read_upload(source, first_chunk, digest)
         try:
-            text = ""
-            with fitz.open(temp_pdf_path) as doc:
-                for page in doc:
-                    text += page.get_text()
-            return text
-        finally:
-            # Clean up the temporary file
-            os.unlink(temp_pdf_path)
-
-    def upload_file(self, file: UploadFile, user_id: int):
+            self.storage.put_stream(original_filename, chunks, content_type)
+        except UploadTooLarge:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File is larger than the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit."
+            )
+        except Exception as e:
+            logger.error(f"Failed to upload {original_filename}: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to upload original file.")
+
+        original_url = self.storage.public_url(original_filename)
+        return {
+            "document_id": document_id,
+            "document_folder": document_folder,
+            "original_name": original_name,
+            "filename": original_filename,
+            "url": str(original_url),
+            "size": source.tell(),
+            "hash": digest.hexdigest()
+        }
+
+    def store_text(self, document_folder: str, original_name: str, extracted_text: str) -> str:
+        """Upload the extracted text next to the original file and return its path."""
+        # Create and upload text file with .txt extension
+        text_filename = f"{document_folder}/{original_name}.txt"
+        # Encode piece by piece instead of building a second full copy of the text
+        text_chunks = (
+            extracted_text[start:start + UPLOAD_CHUNK_SIZE].encode('utf-8')
+            for start in range(0, len(extracted_text), UPLOAD_CHUNK_SIZE)
+        )
         try:
-            file_content = file.file.read()
-            
-            # Create a unique folder for this document
-            document_id = str(uuid.uuid4())
-            user_folder = f"user_{user_id}"
-            document_folder = f"{user_folder}/{document_id}"
-            
-            # Get original filename without extension
-            original_name = os.path.splitext(file.filename)[0]
-            
-            # Upload original file
-            original_filename = f"{document_folder}/{original_name}{os.path.splitext(file.filename)[1]}"
-            response = self.supabase.storage.from_(self.bucket).upload(
-                original_filename, file_content, {"content-type": file.content_type}
+            # A run interrupted before recording text_path may have left the file behind
+            self.storage.delete([text_filename])
+            self.storage.put_stream(text_filename, text_chunks, "text/plain")
+        except Exception as e:
+            logger.error(f"Failed to upload {text_filename}: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to upload text file.")
+        return text_filename
+
+    async def upload_file(self, file: UploadFile, user_id: int, db: AsyncSession):
+        """
+        Stream the original file to storage and queue text extraction and summarization.
+        Returns as soon as the original is stored, see the document status endpoint.
+        """
+        if file.content_type not in ALLOWED_CONTENT_TYPES:
+            raise HTTPException(status_code=415, detail="Only PDF documents can be uploaded.")
+        if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File is larger than the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit."
             )
 
-            if not response:
-                raise HTTPException(status_code=500, detail="Failed to upload original file.")
-
-            # Extract text from PDF
-            extracted_text = self.extract_text_from_pdf(file_content)
-            
-            # Create and upload text file with .txt extension
-            text_filename = f"{document_folder}/{original_name}.txt"
-            text_content = extracted_text.encode('utf-8')
-            text_response = self.supabase.storage.from_(self.bucket).upload(
-                text_filename, text_content, {"content-type": "text/plain"}
+        first_chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        # PDF readers accept the header anywhere in the first kilobyte
+        if PDF_MAGIC not in first_chunk[:1024]:
+            raise HTTPException(status_code=415, detail="The file is not a valid PDF document.")
+        # Refuse before anything is stored when the queue is full
+        ingestion_queue.ensure_capacity()
+
+        try:
+            original = await run_in_threadpool(
+                self.store_original, file.file, first_chunk, file.filename, file.content_type, user_id
             )
 
-            if not text_response:
-                raise HTTPException(status_code=500, detail="Failed to upload text file.")
-
-            # Get public URLs
-            original_url = self.supabase.storage.from_(self.bucket).get_public_url(original_filename)
-            text_url = self.supabase.storage.from_(self.bucket).get_public_url(text_filename)
-
-            return {
-                "document_id": document_id,
-                "original_file": {
-                    "filename": original_filename,
-                    "url": str(original_url)
-                },
-                "text_file": {
-                    "filename": text_filename,
-                    "url": str(text_url)
-                },
-                "message": "Files uploaded successfully.",
-                "user_id": user_id
-            }
+            document = Document(
+                url=original["url"],
+                user_id=user_id,
+                storage_key=original["document_id"],
+                filename=file.filename,
+                mime_type=file.content_type,
+                size_bytes=original["size"],
+                file_hash=original["hash"],
+                original_path=original["filename"],
+                status="pending"
+            )
+            db.add(document)
+            await db.commit()
+            await db.refresh(document)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+
+        # The worker reads the original back from storage, the upload isn't kept in memory
+        try:
+            ingestion_queue.enqueue(IngestionJob(
+                document_id=document.id,
+                document_folder=original["document_folder"],
+                original_name=original["original_name"]
+            ))
+        except HTTPException as e:
+            # The queue filled up while the file was stored, don't leave a pending document behind
+            document.status = "failed"
+            document.error = e.detail
+            document.original_path = None
+            await db.commit()
+            await run_in_threadpool(self.storage.delete, [original["filename"]])
+            raise
+
+        return {
+            "id": document.id,
+            "document_id": original["document_id"],
+            "status": document.status,
+            "original_file": {
+                "filename": original["filename"],
+                "url": original["url"]
+            },
+            "message": "File uploaded, processing started.",
+            "user_id": user_id
+        }
     
-    def get_user_files(self, user_id: int) -> List[FileInfo]:
+    async def get_user_files(self, db: AsyncSession, user_id: int) -> List[FileInfo]:
+        """
+        List a user's documents from the documents table, storage is only used to sign URLs.
+        """
         try:
-            # List files in user's folder
-            user_folder = f"user_{user_id}"
-            logger.debug(f"Fetching files from folder: {user_folder}")
-            
-            # First, get the list of document folders
-            folders = self.supabase.storage.from_(self.bucket).list(user_folder)
-            logger.debug(f"Found folders: {folders}")
-            
-            if not folders:
-                logger.debug("No folders found in user folder")
-                return []
-            
-            # Group files by document folder
-            document_files = {}
-            
-            # For each folder, get its contents
-            for folder in folders:
-                folder_name = folder['name']
-                logger.debug(f"Processing folder: {folder_name}")
-                
-                # Get contents of this folder with the full path
-                folder_path = f"{user_folder}/{folder_name}"
-                logger.debug(f"Listing contents of: {folder_path}")
-                folder_contents = self.supabase.storage.from_(self.bucket).list(folder_path)
-                logger.debug(f"Folder contents: {folder_contents}")
-                
-                if not folder_contents:
-                    continue
-                
-                document_files[folder_name] = {
-                    'original_file': None,
-                    'text_file': None,
-                    'created_at': folder['created_at'] or folder_contents[0]['created_at'],
-                    'last_accessed_at': folder['last_accessed_at'] or folder_contents[0]['last_accessed_at']
+            documents = (await db.execute(
+                select(Document)
+                .where(Document.user_id == user_id)
+                .order_by(Document.created_at.asc())
+            )).scalars().all()
+            paths = [path for document in documents for path in (document.original_path, document.text_path) if path]
+            # Signing missing URLs may call the storage service
+            signed = await run_in_threadpool(signed_url_cache.get_many, paths) if paths else {}
+
+            def file_entry(path: Optional[str]) -> Optional[dict]:
+                if not path or path not in signed:
+                    return None
+                return {
+                    'filename': path,
+                    'url': signed[path][0]
                 }
-                
-                # Process each file in the folder
-                for file in folder_contents:
-                    filename = file['name']
-                    logger.debug(f"Processing file: {filename}")
-                    
-                    # Determine if this is the original file or text file
-                    if filename.endswith('.txt'):
-                        logger.debug(f"Found text file: {filename}")
-                        file_path = f"{folder_path}/{filename}"
-                        signed_url = self.supabase.storage.from_(self.bucket).create_signed_url(file_path, 60)  # URL expires in 60 seconds
-                        document_files[folder_name]['text_file'] = {
-                            'filename': file_path,
-                            'url': signed_url['signedURL']
-                        }
-                    else:
-                        logger.debug(f"Found original file: {filename}")
-                        file_path = f"{folder_path}/{filename}"
-                        signed_url = self.supabase.storage.from_(self.bucket).create_signed_url(file_path, 60)  # URL expires in 60 seconds
-                        document_files[folder_name]['original_file'] = {
-                            'filename': file_path,
-                            'url': signed_url['signedURL']
-                        }
-            
-            logger.debug(f"Grouped document files: {document_files}")
-            
-            # Convert to list of FileInfo objects
-            file_info_list = []
-            for doc_id, files in document_files.items():
-                # Include documents that have at least one file
-                if files['original_file'] or files['text_file']:
-                    logger.debug(f"Adding document: {doc_id}")
-                    file_info = FileInfo(
-                        document_id=doc_id,
-                        original_file=files['original_file'],
-                        text_file=files['text_file'],
-                        created_at=files['created_at'],
-                        last_accessed_at=files['last_accessed_at']
-                    )
-                    file_info_list.append(file_info)
-                else:
-                    logger.debug(f"Skipping empty document {doc_id}")
-            
-            logger.debug(f"Final file info list: {file_info_list}")
-            return file_info_list
-            
+
+            def urls_expire_at(document: Document) -> Optional[str]:
+                expiries = [signed[path][1] for path in (document.original_path, document.text_path) if path in signed]
+                return datetime.fromtimestamp(min(expiries), timezone.utc).isoformat(timespec="seconds") if expiries else None
+
+            files = [
+                FileInfo(
+                    id=document.id,
+                    document_id=document.storage_key or str(document.id),
+                    status=document.status,
+                    original_file=file_entry(document.original_path),
+                    text_file=file_entry(document.text_path),
+                    created_at=document.created_at.isoformat(),
+                    last_accessed_at=document.updated_at.isoformat(),
+                    urls_expire_at=urls_expire_at(document)
+                )
+                for document in documents
+            ]
+            return files
         except Exception as e:
             logger.error(f"Error in get_user_files: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
-uploader = DocumentUploader(supabase, BUCKET_NAME)
+    def list_storage_documents(self, user_folder: str) -> List[dict]:
+        """
+        Crawl a user folder in storage and group its files by document folder.
+        Only used to index documents uploaded before the documents table was filled.
+        """
+        documents = []
+        for folder in self.storage.list(user_folder):
+            folder_path = f"{user_folder}/{folder['name']}"
+            document = {
+                'storage_key': folder['name'],
+                'original_file': None,
+                'text_file': None
+            }
+            for file in self.storage.list(folder_path):
+                file_path = f"{folder_path}/{file['name']}"
+                # Determine if this is the original file or text file
+                if file['name'].endswith('.txt'):
+                    document['text_file'] = file_path
+                else:
+                    document['original_file'] = file_path
+                    document['mime_type'] = (file.get('metadata') or {}).get('mimetype')
+                    document['size_bytes'] = (file.get('metadata') or {}).get('size')
+            if document['original_file'] or document['text_file']:
+                documents.append(document)
+        return documents
+
+uploader = DocumentUploader(get_storage())
+signed_url_cache = SignedUrlCache(uploader.storage.signed_urls)
+register_metrics("signed_urls", signed_url_cache.stats)
+ingestion_queue = IngestionQueue(uploader)
 
-@router.post("/")
+@router.post("/", status_code=status.HTTP_202_ACCEPTED)
 async def upload(
     file: UploadFile = File(...),
-    current_user: Annotated[User, Depends(get_current_active_user)] = None,
-    db: Session = Depends(get_db)
+    current_user: Annotated[TokenClaims, Depends(get_current_claims)] = None,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Upload a document. Files are stored in user-specific folders.
+    Text extraction and summarization run in the background, poll
+    /upload/documents/{id}/status until the document is ready.
     Requires authentication.
     """
     if not current_user:
@@ -217,15 +302,41 @@ async def upload(
             detail="Authentication required"
         )
     
-    return uploader.upload_file(file, current_user.id)
+    return await uploader.upload_file(file, current_user.id, db)
+
+@router.get("/documents/{document_id}/status", response_model=DocumentStatus)
+async def get_document_status(
+    document_id: int,
+    current_user: Annotated[TokenClaims, Depends(get_current_claims)] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get the processing status of an uploaded document: pending, processing, ready or failed.
+    Requires authentication.
+    """
+    document = await db.get(Document, document_id)
+    if not document or document.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    return DocumentStatus(
+        id=document.id,
+        status=document.status,
+        error=document.error,
+        summary_ready=document.summary is not None,
+        created_at=document.created_at,
+        updated_at=document.updated_at
+    )
 
 @router.get("/files", response_model=List[FileInfo])
 async def get_user_files(
-    current_user: Annotated[User, Depends(get_current_active_user)] = None,
-    db: Session = Depends(get_db)
+    response: Response,
+    current_user: Annotated[TokenClaims, Depends(get_current_claims)] = None,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get all files uploaded by the current user.
+    Browsers must revalidate the listing, since it changes with every upload;
+    the frontend keeps it until the earliest `urls_expire_at` and refetches after uploading.
     Requires authentication.
     """
     if not current_user:
@@ -234,12 +345,14 @@ async def get_user_files(
             detail="Authentication required"
         )
     
-    return uploader.get_user_files(current_user.id)
+    files = await uploader.get_user_files(db, current_user.id)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return files
 
 @router.get("/debug/list-all")
 async def list_all_files(
-    current_user: Annotated[User, Depends(get_current_active_user)] = None,
-    db: Session = Depends(get_db)
+    current_user: Annotated[TokenClaims, Depends(get_current_claims)] = None,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Debug endpoint to list all files in the bucket.
@@ -253,7 +366,33 @@ async def list_all_files(
     
     try:
         # List all files in the bucket
-        all_files = uploader.supabase.storage.from_(uploader.bucket).list()
+        all_files = uploader.storage.list()
         return {"files": all_files}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/local/{path:path}")
+def serve_local_file(path: str, expires: int, signature: str):
+    """
+    Serve a file of the local storage backend through a signed URL.
+    Only available when STORAGE_BACKEND=local.
+    """
+    storage = uploader.storage
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not storage.verify_signature(path, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+    try:
+        chunks = storage.stream(path)
+        # Open the file now so a missing one is reported as 404, not as a broken stream
+        first_chunk = next(chunks, b"")
+    except (FileNotFoundError, ValueError):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    def content():
+        yield first_chunk
+        yield from chunks
+
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return StreamingResponse(content(), media_type=media_type)
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Lifetime of issued URLs and how long before expiry they stop being handed out
+SIGNED_URL_EXPIRES_IN = int(os.getenv("SIGNED_URL_EXPIRES_IN", "3600"))
+SIGNED_URL_REFRESH_MARGIN = int(os.getenv("SIGNED_URL_REFRESH_MARGIN", "300"))
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", "10000"))
+
+
+class SignedUrlCache:
+    """
+    Issues signed URLs in batches and reuses them until shortly before they expire.
+
+    `sign_many(paths, expires_in)` must return a {path: url} dict for the given paths.
+    """
+
+    def __init__(
+        self,
+        sign_many: Callable[[List[str], int], Dict[str, str]],
+        expires_in: int = SIGNED_URL_EXPIRES_IN,
+        refresh_margin: int = SIGNED_URL_REFRESH_MARGIN,
+        max_entries: int = SIGNED_URL_CACHE_SIZE
+    ):
+        self.sign_many = sign_many
+        self.expires_in = expires_in
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+
+    def get_many(self, paths: List[str]) -> Dict[str, Tuple[str, float]]:
+        """Return {path: (url, expires_at)}, signing every missing path in a single call."""
+        now = time.time()
+        result = {}
+        missing = []
+        with self._lock:
+            for path in dict.fromkeys(paths):
+                entry = self._entries.get(path)
+                if entry is not None and entry[1] - self.refresh_margin > now:
+                    self._entries.move_to_end(path)
+                    result[path] = entry
+                    self.hits += 1
+                else:
+                    missing.append(path)
+                    self.misses += 1
+
+        if missing:
+            expires_at = now + self.expires_in
+            signed = self.sign_many(missing, self.expires_in)
+            with self._lock:
+                self.batches += 1
+                for path, url in signed.items():
+                    self._entries[path] = (url, expires_at)
+                    self._entries.move_to_end(path)
+                    result[path] = (url, expires_at)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self, paths: List[str]):
+        with self._lock:
+            for path in paths:
+                self._entries.pop(path, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "batches": self.batches,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
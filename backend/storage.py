@@ -0,0 +1,239 @@
+import hashlib
+import hmac
+import mimetypes
+import mmap
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "supabase" or "local"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+BUCKET_NAME = "documents"
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", os.path.join(os.path.dirname(__file__), "storage_data"))
+# Base URL the API is reachable at, used to build signed URLs for local files
+LOCAL_STORAGE_BASE_URL = os.getenv("LOCAL_STORAGE_BASE_URL", "http://localhost:8000")
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class StorageBackend(ABC):
+    """Object storage for uploaded documents, addressed by slash-separated paths."""
+
+    @abstractmethod
+    def put(self, path: str, data: bytes, content_type: str):
+        """Store `data` at `path`, failing if it already exists."""
+
+    def put_stream(self, path: str, chunks: Iterable[bytes], content_type: str):
+        """Store the concatenation of `chunks` at `path`."""
+        self.put(path, b"".join(chunks), content_type)
+
+    @abstractmethod
+    def get(self, path: str) -> bytes:
+        """Return the content of `path`."""
+
+    def stream(self, path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield the content of `path` in chunks."""
+        data = self.get(path)
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> List[dict]:
+        """List the entries directly under `prefix` as dicts with at least a `name` key."""
+
+    @abstractmethod
+    def signed_urls(self, paths: List[str], expires_in: int) -> Dict[str, str]:
+        """Return {path: url} granting read access to each path for `expires_in` seconds."""
+
+    def signed_url(self, path: str, expires_in: int) -> Optional[str]:
+        return self.signed_urls([path], expires_in).get(path)
+
+    @abstractmethod
+    def public_url(self, path: str) -> str:
+        """Return the unsigned URL of `path`."""
+
+    @abstractmethod
+    def delete(self, paths: List[str]):
+        """Delete the given paths, ignoring missing ones."""
+
+
+class SupabaseStorage(StorageBackend):
+    """Supabase Storage bucket. The client is created on first use."""
+
+    def __init__(self, url: Optional[str], key: Optional[str], bucket: str):
+        self.url = url
+        self.key = key
+        self.bucket = bucket
+        self._client = None
+
+    @property
+    def _bucket(self):
+        if self._client is None:
+            from supabase import create_client
+            self._client = create_client(self.url, self.key)
+        return self._client.storage.from_(self.bucket)
+
+    def put(self, path: str, data: bytes, content_type: str):
+        response = self._bucket.upload(path, data, {"content-type": content_type})
+        if not response:
+            raise IOError(f"Failed to upload {path}")
+
+    def put_stream(self, path: str, chunks: Iterable[bytes], content_type: str):
+        # Spool to disk so the client can send the file without holding it in memory
+        with tempfile.NamedTemporaryFile(prefix="upload-") as spool:
+            for chunk in chunks:
+                spool.write(chunk)
+            spool.flush()
+            # The client streams only bytes, BufferedReader or FileIO, a read-only reopen is a BufferedReader
+            with open(spool.name, "rb") as reader:
+                response = self._bucket.upload(path, reader, {"content-type": content_type})
+        if not response:
+            raise IOError(f"Failed to upload {path}")
+
+    def get(self, path: str) -> bytes:
+        return self._bucket.download(path)
+
+    def list(self, prefix: str = "") -> List[dict]:
+        return self._bucket.list(prefix) or []
+
+    def signed_urls(self, paths: List[str], expires_in: int) -> Dict[str, str]:
+        signed = self._bucket.create_signed_urls(paths, expires_in)
+        return {
+            item['path']: item.get('signedURL') or item.get('signedUrl')
+            for item in signed
+            if not item.get('error') and item.get('path')
+        }
+
+    def public_url(self, path: str) -> str:
+        return str(self._bucket.get_public_url(path))
+
+    def delete(self, paths: List[str]):
+        if paths:
+            self._bucket.remove(paths)
+
+
+class LocalStorage(StorageBackend):
+    """
+    Files under a local directory. Writes are streamed to a temporary file and
+    renamed into place, reads go through memory-mapped files. Signed URLs point
+    to /upload/local and carry an HMAC of the path and expiry time.
+    """
+
+    def __init__(self, root: str, base_url: str, secret: str):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        self.secret = secret.encode("utf-8")
+        os.makedirs(self.root, exist_ok=True)
+
+    def _full_path(self, path: str) -> str:
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, full_path]) != self.root:
+            raise ValueError(f"Invalid storage path: {path}")
+        return full_path
+
+    def put(self, path: str, data: bytes, content_type: str):
+        self.put_stream(path, [data], content_type)
+
+    def put_stream(self, path: str, chunks: Iterable[bytes], content_type: str):
+        full_path = self._full_path(path)
+        if os.path.exists(full_path):
+            raise FileExistsError(f"{path} already exists")
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                for chunk in chunks:
+                    temp_file.write(chunk)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def get(self, path: str) -> bytes:
+        # Callers need bytes, which a single read produces without an intermediate mapping
+        with open(self._full_path(path), "rb") as file:
+            return file.read()
+
+    def stream(self, path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self._full_path(path), "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, size, chunk_size):
+                    yield mapped[start:start + chunk_size]
+
+    def list(self, prefix: str = "") -> List[dict]:
+        directory = self._full_path(prefix)
+        if not os.path.isdir(directory):
+            return []
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.startswith(".upload-"):
+                continue
+            stat = entry.stat()
+            entries.append({
+                "name": entry.name,
+                "created_at": datetime.utcfromtimestamp(stat.st_ctime).isoformat(),
+                "last_accessed_at": datetime.utcfromtimestamp(stat.st_atime).isoformat(),
+                "metadata": None if entry.is_dir() else {
+                    "size": stat.st_size,
+                    "mimetype": mimetypes.guess_type(entry.name)[0]
+                }
+            })
+        return entries
+
+    def _signature(self, path: str, expires: int) -> str:
+        return hmac.new(self.secret, f"{path}:{expires}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def verify_signature(self, path: str, expires: int, signature: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(path, expires), signature)
+
+    def signed_urls(self, paths: List[str], expires_in: int) -> Dict[str, str]:
+        expires = int(time.time()) + expires_in
+        return {
+            path: f"{self.public_url(path)}?expires={expires}&signature={self._signature(path, expires)}"
+            for path in paths
+        }
+
+    def public_url(self, path: str) -> str:
+        return f"{self.base_url}/upload/local/{quote(path)}"
+
+    def delete(self, paths: List[str]):
+        for path in paths:
+            try:
+                os.unlink(self._full_path(path))
+            except FileNotFoundError:
+                pass
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Return the storage backend selected by STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            secret = os.getenv("LOCAL_STORAGE_SECRET") or os.getenv("SECRET_KEY")
+            if not secret:
+                raise ValueError("LOCAL_STORAGE_SECRET or SECRET_KEY must be set to sign local storage URLs")
+            _storage = LocalStorage(LOCAL_STORAGE_ROOT, LOCAL_STORAGE_BASE_URL, secret)
+        elif STORAGE_BACKEND == "supabase":
+            _storage = SupabaseStorage(SUPABASE_URL, SUPABASE_KEY, BUCKET_NAME)
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _storage
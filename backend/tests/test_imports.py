@@ -0,0 +1,25 @@
+"""Smoke tests: modules that build engines and pools at import time must import without a database."""
+import importlib
+
+import pytest
+
+
+@pytest.mark.parametrize("module", ["database", "models", "pool_metrics", "benchmark_indexes"])
+def test_module_imports(module):
+    importlib.import_module(module)
+
+
+def test_async_pool_is_instrumented():
+    database = importlib.import_module("database")
+    pool = database.async_engine.sync_engine.pool
+    assert type(pool).__name__ == "InstrumentedAsyncAdaptedQueuePool"
+    # Listeners registered on the engine are carried by its pool
+    assert len(pool.dispatch.checkout) == 1
+    assert len(pool.dispatch.checkin) == 1
+
+
+def test_pool_stats_snapshot():
+    database = importlib.import_module("database")
+    stats = database.pool_stats.snapshot(database.async_engine.pool)
+    assert stats["size"] == database.POOL_OPTIONS["pool_size"]
+    assert stats["checkouts"] == 0
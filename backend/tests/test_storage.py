@@ -0,0 +1,39 @@
+"""SupabaseStorage against the argument handling of the real storage3 client."""
+import types
+
+import pytest
+
+from storage import SupabaseStorage
+
+storage3 = pytest.importorskip("storage3")
+
+
+def make_storage(monkeypatch, captured):
+    client = storage3.SyncStorageClient("http://localhost:54321/storage/v1/", {"apikey": "test"})
+    bucket = client.from_("documents")
+
+    def fake_request(self, method, url, *args, **kwargs):
+        # storage3 has already turned the file argument into the multipart payload
+        name, file, content_type = kwargs["files"]["file"][:3]
+        captured["content"] = file if isinstance(file, bytes) else file.read()
+        captured["content_type"] = content_type
+        return types.SimpleNamespace(json=lambda: {"Key": f"documents/{name}"})
+
+    monkeypatch.setattr(type(bucket), "_request", fake_request)
+    storage = SupabaseStorage("http://localhost:54321", "test", "documents")
+    storage._client = types.SimpleNamespace(storage=client)
+    return storage
+
+
+def test_put_stream_uploads_all_chunks(monkeypatch):
+    captured = {}
+    storage = make_storage(monkeypatch, captured)
+    storage.put_stream("user_1/doc/report.pdf", [b"%PDF-1.7\n", b"x" * 1024, b"%%EOF"], "application/pdf")
+    assert captured["content"] == b"%PDF-1.7\n" + b"x" * 1024 + b"%%EOF"
+
+
+def test_put_uploads_bytes(monkeypatch):
+    captured = {}
+    storage = make_storage(monkeypatch, captured)
+    storage.put("user_1/doc/report.txt", b"extracted text", "text/plain")
+    assert captured["content"] == b"extracted text"
@@ -0,0 +1,108 @@
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Type
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached, with_polymorphic
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import User
+
+# How long an authenticated user is reused without hitting the database. Updates
+# made through this worker invalidate immediately, other workers catch up after the TTL.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+_any_user = with_polymorphic(User, "*")
+
+
+class UserCache:
+    """
+    Column values of recently authenticated users, keyed by token subject (email).
+
+    Entries are snapshots rather than ORM instances, so they never carry expired
+    attributes or a closed session. A hit is rebuilt into an instance attached to
+    the request's session without a query; relationships still load lazily.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL_SECONDS, max_entries: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Type[User], Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, db: AsyncSession, email: str) -> Optional[User]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(email)
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+        if entry is not None:
+            return await self._attach(db, entry[0], entry[1])
+
+        # Load the subclass columns in the same query instead of a second SELECT per role
+        user = (await db.execute(select(_any_user).where(_any_user.email == email))).scalars().first()
+        if user is not None:
+            self.put(user)
+        return user
+
+    def put(self, user: User):
+        mapper = inspect(user).mapper
+        values = copy.deepcopy({attribute.key: getattr(user, attribute.key) for attribute in mapper.column_attrs})
+        with self._lock:
+            self._entries[user.email] = (mapper.class_, values, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    async def _attach(db: AsyncSession, cls: Type[User], values: Dict[str, Any]) -> User:
+        user = cls.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            # JSONB values are dicts and lists, each request gets its own copy
+            set_committed_value(user, key, copy.deepcopy(value))
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+
+    def invalidate(self, *emails: Optional[str]):
+        with self._lock:
+            for email in emails:
+                if email is not None and self._entries.pop(email, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, "after_update", propagate=True)
+@event.listens_for(User, "after_delete", propagate=True)
+def _invalidate_user(mapper, connection, target):
+    # Covers profile updates, deactivation and deletion of any user subclass,
+    # including a changed email (the old subject is dropped as well)
+    history = inspect(target).attrs.email.history
+    user_cache.invalidate(target.email, *(history.deleted or ()))
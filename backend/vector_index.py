@@ -0,0 +1,254 @@
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from metrics import register_metrics
+from models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+# Size of the hashed feature space
+VECTOR_DIMENSIONS = int(os.getenv("VECTOR_DIMENSIONS", str(2 ** 18)))
+# Number of users whose index is kept in memory by this worker
+VECTOR_INDEX_CACHE_USERS = int(os.getenv("VECTOR_INDEX_CACHE_USERS", "256"))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "has", "have",
+    "i", "in", "is", "it", "its", "me", "my", "of", "on", "or", "that", "the", "this", "to",
+    "was", "what", "with", "you", "your", "can", "how", "why", "which", "there", "about",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words used for matching, without stopwords and single characters."""
+    return [word for word in _WORD_RE.findall(text.lower()) if len(word) > 1 and word not in _STOPWORDS]
+
+
+def vectorize(text: str, dimensions: int = VECTOR_DIMENSIONS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hash the words of `text` into a sparse vector with sublinear term frequencies,
+    normalized to unit length. Returns (sorted feature indices, weights).
+    """
+    words = tokenize(text)
+    if not words:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+    # crc32 is stable across processes, unlike hash()
+    hashed = np.fromiter((zlib.crc32(word.encode("utf-8")) % dimensions for word in words), dtype=np.int32, count=len(words))
+    indices, counts = np.unique(hashed, return_counts=True)
+    weights = (1.0 + np.log(counts)).astype(np.float32)
+    weights /= np.linalg.norm(weights)
+    return indices.astype(np.int32), weights
+
+
+def pack_vector(indices: np.ndarray, weights: np.ndarray) -> Tuple[bytes, bytes]:
+    return indices.astype(np.int32).tobytes(), weights.astype(np.float32).tobytes()
+
+
+def unpack_vector(indices: bytes, weights: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    return np.frombuffer(indices, dtype=np.int32), np.frombuffer(weights, dtype=np.float32)
+
+
+class ChunkIndex:
+    """
+    The chunk vectors of one user, in CSR layout (rows are chunks) for updates and
+    in an inverted layout (postings of each feature) for search, so a query only
+    touches the postings of its own features.
+
+    Scores are the cosine between the chunk's normalized term frequencies and the
+    query weighted by inverse document frequency, so the IDF stays correct as
+    chunks are added or removed without re-weighting stored vectors.
+    """
+
+    def __init__(self, dimensions: int = VECTOR_DIMENSIONS):
+        self.dimensions = dimensions
+        self.chunk_ids = np.empty(0, dtype=np.int64)
+        self.document_ids = np.empty(0, dtype=np.int64)
+        self.token_counts = np.empty(0, dtype=np.int32)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.weights = np.empty(0, dtype=np.float32)
+        self._build_postings()
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def _build_postings(self):
+        """
+        Rebuild the inverted layout: the sorted distinct features, where each one's
+        postings start, and the (row, weight) postings grouped by feature. A chunk
+        holds a feature at most once, so the postings count is its document frequency.
+        """
+        order = np.argsort(self.indices, kind="stable")
+        rows = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+        self._terms, starts, self._term_counts = np.unique(
+            self.indices[order], return_index=True, return_counts=True
+        )
+        self._term_starts = starts.astype(np.int64)
+        self._posting_rows = rows[order]
+        self._posting_weights = self.weights[order]
+
+    def add(self, rows: List[Tuple[int, int, int, np.ndarray, np.ndarray]]):
+        """Append (chunk id, document id, token count, indices, weights) rows."""
+        if not rows:
+            return
+        lengths = np.array([len(row[3]) for row in rows], dtype=np.int64)
+        self.chunk_ids = np.concatenate([self.chunk_ids, np.array([row[0] for row in rows], dtype=np.int64)])
+        self.document_ids = np.concatenate([self.document_ids, np.array([row[1] for row in rows], dtype=np.int64)])
+        self.token_counts = np.concatenate([self.token_counts, np.array([row[2] for row in rows], dtype=np.int32)])
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(lengths)])
+        self.indices = np.concatenate([self.indices] + [row[3] for row in rows])
+        self.weights = np.concatenate([self.weights] + [row[4] for row in rows])
+        self._build_postings()
+
+    def remove_document(self, document_id: int):
+        keep_rows = self.document_ids != document_id
+        if keep_rows.all():
+            return
+        lengths = np.diff(self.indptr)
+        keep_values = np.repeat(keep_rows, lengths)
+        self.chunk_ids = self.chunk_ids[keep_rows]
+        self.document_ids = self.document_ids[keep_rows]
+        self.token_counts = self.token_counts[keep_rows]
+        self.indptr = np.concatenate([[0], np.cumsum(lengths[keep_rows])]).astype(np.int64)
+        self.indices = self.indices[keep_values]
+        self.weights = self.weights[keep_values]
+        self._build_postings()
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, int, float]]:
+        """Return up to `limit` (chunk id, token count, score) with a positive score, best first."""
+        if not len(self) or limit <= 0 or not len(self._terms):
+            return []
+        query_indices, query_weights = vectorize(query, self.dimensions)
+        if not len(query_indices):
+            return []
+
+        # Find the query features among the stored ones
+        positions = np.clip(np.searchsorted(self._terms, query_indices), 0, len(self._terms) - 1)
+        matched = self._terms[positions] == query_indices
+        if not matched.any():
+            return []
+        document_frequency = np.where(matched, self._term_counts[positions], 0)
+
+        # Inverse document frequency of the query features within this user's chunks
+        idf = np.log((1 + len(self)) / (1 + document_frequency)) + 1.0
+        weighted = query_weights * idf.astype(np.float32)
+        weighted /= np.linalg.norm(weighted)
+
+        # Gather the postings of the matched features only
+        starts = self._term_starts[positions[matched]]
+        counts = document_frequency[matched].astype(np.int64)
+        offsets = np.cumsum(counts) - counts
+        gather = np.repeat(starts - offsets, counts) + np.arange(counts.sum(), dtype=np.int64)
+        products = self._posting_weights[gather] * np.repeat(weighted[matched], counts)
+        scores = np.bincount(self._posting_rows[gather], weights=products, minlength=len(self))
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(self.chunk_ids[i]), int(self.token_counts[i]), float(scores[i])) for i in candidates]
+
+
+class VectorIndexStore:
+    """
+    Per-user chunk indexes kept in memory, least recently used users evicted.
+
+    Each lookup compares the number and highest id of the user's chunks with
+    the loaded index. New chunks, including those written by other workers,
+    are added incrementally; anything else triggers a full reload.
+    """
+
+    def __init__(self, max_users: int = VECTOR_INDEX_CACHE_USERS):
+        self.max_users = max_users
+        self._indexes: "OrderedDict[int, Tuple[Tuple[int, int], ChunkIndex]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.updates = 0
+        self.loads = 0
+
+    async def get(self, db: AsyncSession, user_id: int) -> ChunkIndex:
+        count, max_id = (await db.execute(
+            select(func.count(DocumentChunk.id), func.coalesce(func.max(DocumentChunk.id), 0))
+            .where(DocumentChunk.user_id == user_id)
+        )).one()
+        signature = (count, max_id)
+        with self._lock:
+            cached = self._indexes.get(user_id)
+            if cached is not None:
+                self._indexes.move_to_end(user_id)
+                if cached[0] == signature:
+                    self.hits += 1
+                    return cached[1]
+
+        index = None
+        if cached is not None:
+            index = await self._update(db, user_id, cached[0], cached[1], signature)
+        if index is None:
+            index = ChunkIndex()
+            index.add(await self._load_rows(db, user_id))
+            self.loads += 1
+        with self._lock:
+            self._indexes[user_id] = (signature, index)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    async def _update(self, db: AsyncSession, user_id: int, old_signature: Tuple[int, int], index: ChunkIndex, signature: Tuple[int, int]) -> Optional[ChunkIndex]:
+        """Apply the chunks added since `old_signature`, or return None if a reload is needed."""
+        rows = await self._load_rows(db, user_id, after_id=old_signature[1])
+        # Chunks of re-indexed documents replace their previous chunks
+        for document_id in {row[1] for row in rows}:
+            index.remove_document(document_id)
+        index.add(rows)
+        if len(index) != signature[0]:
+            return None
+        self.updates += 1
+        return index
+
+    async def _load_rows(self, db: AsyncSession, user_id: int, after_id: int = 0) -> List[Tuple[int, int, int, np.ndarray, np.ndarray]]:
+        chunks = (await db.execute(
+            select(DocumentChunk)
+            .where(DocumentChunk.user_id == user_id, DocumentChunk.id > after_id)
+            .order_by(DocumentChunk.id.asc())
+        )).scalars().all()
+        rows = []
+        backfilled = False
+        for chunk in chunks:
+            if chunk.vector_indices is None or chunk.vector_weights is None:
+                # Chunk stored before vectors were persisted
+                indices, weights = vectorize(chunk.content)
+                chunk.vector_indices, chunk.vector_weights = pack_vector(indices, weights)
+                backfilled = True
+            else:
+                indices, weights = unpack_vector(chunk.vector_indices, chunk.vector_weights)
+            rows.append((chunk.id, chunk.document_id, chunk.token_count, indices, weights))
+        if backfilled:
+            await db.commit()
+        return rows
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._indexes),
+            "hits": self.hits,
+            "updates": self.updates,
+            "loads": self.loads,
+            "chunks": sum(len(index) for _, index in self._indexes.values()),
+        }
+
+
+vector_indexes = VectorIndexStore()
+register_metrics("vector_index", vector_indexes.stats)
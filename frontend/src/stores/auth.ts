@@ -60,6 +60,7 @@ export const useAuthStore = defineStore('auth', () => {
 
       token.value = response.data['access_token']
       tokenType.value = response.data.token_type
+      refreshToken.value = response.data['refresh_token']
 
       await initialize()
     } catch (e: Error | any) {
@@ -88,6 +89,7 @@ export const useAuthStore = defineStore('auth', () => {
       const response = await axios.post('auth/token', formData)
       token.value = response.data['access_token']
       tokenType.value = response.data['token_type']
+      refreshToken.value = response.data['refresh_token']
 
       await initialize()
     } catch (e: Error | any) {
@@ -101,17 +103,63 @@ export const useAuthStore = defineStore('auth', () => {
   }
 
   const logout = async () => {
+    const currentRefreshToken = refreshToken.value
     user.value = null
     token.value = null
     refreshToken.value = null
 
-    await axios.post('/auth/logout')
+    await axios.post('/auth/logout', { refresh_token: currentRefreshToken })
   }
 
+  // Access tokens are short-lived; a single refresh is shared by concurrent failing requests
+  let refreshing: Promise<boolean> | null = null
+
   const refreshAuthToken = async () => {
-    return
+    if (!refreshToken.value) {
+      return false
+    }
+    if (!refreshing) {
+      refreshing = axios
+        .post('/auth/refresh', { refresh_token: refreshToken.value })
+        .then((response) => {
+          token.value = response.data['access_token']
+          tokenType.value = response.data['token_type']
+          refreshToken.value = response.data['refresh_token']
+          axios.defaults.headers.common['Authorization'] = `Bearer ${token.value}`
+          return true
+        })
+        .catch(() => {
+          user.value = null
+          token.value = null
+          refreshToken.value = null
+          return false
+        })
+        .finally(() => {
+          refreshing = null
+        })
+    }
+    return refreshing
   }
 
+  axios.interceptors.response.use(undefined, async (error) => {
+    const request = error.config
+    const url = request?.url || ''
+    if (
+      error.response?.status === 401 &&
+      request &&
+      !request._retried &&
+      !url.includes('auth/token') &&
+      !url.includes('auth/refresh')
+    ) {
+      request._retried = true
+      if (await refreshAuthToken()) {
+        request.headers['Authorization'] = `Bearer ${token.value}`
+        return axios(request)
+      }
+    }
+    return Promise.reject(error)
+  })
+
   const initialize = async () => {
     if (!token.value) {
       token.value = null
@@ -0,0 +1,48 @@
+import { ref } from 'vue'
+import { defineStore } from 'pinia'
+import axios from 'axios'
+import { useAuthStore } from '@/stores/auth'
+
+export type FileInfo = {
+  document_id: string
+  original_file: {
+    filename: string
+    url: string
+  }
+  text_file: {
+    filename: string
+    url: string
+  }
+  created_at: string
+  last_accessed_at: string
+  urls_expire_at: string | null
+}
+
+export const useDocumentsStore = defineStore('documents', () => {
+  const auth = useAuthStore()
+  const files = ref<FileInfo[] | null>(null)
+  // The listing is reused until its first signed URL expires, or it is for another user
+  let expiresAt = 0
+  let userId: number | null = null
+
+  const earliestExpiry = (listing: FileInfo[]) => {
+    const expiries = listing
+      .filter((file) => file.urls_expire_at)
+      .map((file) => Date.parse(file.urls_expire_at as string))
+    return expiries.length ? Math.min(...expiries) : Infinity
+  }
+
+  const fetchFiles = async (force = false) => {
+    const currentUserId = auth.user?.id ?? null
+    if (!force && files.value !== null && userId === currentUserId && Date.now() < expiresAt) {
+      return files.value
+    }
+    const response = await axios.get('/upload/files')
+    files.value = response.data
+    expiresAt = earliestExpiry(response.data)
+    userId = currentUserId
+    return files.value
+  }
+
+  return { files, fetchFiles }
+})